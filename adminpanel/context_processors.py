@@ -1,3 +1,6 @@
+from .roles import role_names
+
+
 def role_flags(request):
     user = request.user
     if not user.is_authenticated:
@@ -7,7 +10,7 @@ def role_flags(request):
             'can_customers': False,
             'can_staff': False,
         }
-    names = set(user.groups.values_list('name', flat=True))
+    names = role_names(user)
     is_admin = user.is_superuser or 'Admin' in names
     return {
         'can_catalogue': is_admin or 'Manager' in names or 'Merchandiser' in names,
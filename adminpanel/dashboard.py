@@ -0,0 +1,53 @@
+"""KPIs for the admin dashboard (``views.adminpanel``).
+
+Product KPIs are one conditional aggregate over Product and the sales KPIs
+come from the daily rollups (see ``rollups.py``). The combined result is
+cached per category and date range under the catalog version, which stock
+and product changes bump, and the sales version, which rollup refreshes
+bump, so a repeat load is a single cache read.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, FloatField, Q, Sum
+
+from onlineshopfront import caching
+from onlineshopfront.models import Product
+from . import rollups
+
+KPI_CACHE_KEY = 'adminpanel:kpis:{catalog}:{sales}:{category}:{start}:{end}'
+KPI_CACHE_TIMEOUT = 60 * 10
+
+
+def product_kpis(category_id=None):
+    products = Product.objects.all()
+    if category_id:
+        products = products.filter(category_id=category_id)
+    totals = products.aggregate(
+        total_skus=Count('pk'),
+        low_stock_count=Count('pk', filter=Q(quantity_on_hand__lte=F('reorder_quantity'))),
+        total_units=Sum('quantity_on_hand'),
+        inventory_value=Sum(F('quantity_on_hand') * F('unit_price'), output_field=FloatField()),
+    )
+    return {
+        'total_skus': totals['total_skus'],
+        'low_stock_count': totals['low_stock_count'],
+        'total_units': totals['total_units'] or 0,
+        'inventory_value': totals['inventory_value'] or 0.0,
+    }
+
+
+def _compute(category_id, start, end):
+    sales = rollups.sales_summary(start, end, category_id)
+    return {
+        **product_kpis(category_id),
+        'sales_revenue': sales['revenue'],
+        'units_sold': sales['units'],
+        'orders_count': sales['orders'],
+        'top_products': sales['top_products'],
+    }
+
+
+def kpis(category_id, start, end):
+    """All dashboard KPIs for a category (or all) and date range, cached."""
+    key = KPI_CACHE_KEY.format(catalog=caching.catalog_version(), sales=rollups.sales_version(),
+                               category=category_id or 'all', start=start.isoformat(), end=end.isoformat())
+    return cache.get_or_set(key, lambda: _compute(category_id, start, end), KPI_CACHE_TIMEOUT)
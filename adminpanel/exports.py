@@ -0,0 +1,174 @@
+"""CSV exports of the admin lists.
+
+Rows are read with ``.values_list(...).iterator(chunk_size=...)``, only
+the exported columns, and written out one line at a time, so memory stays
+flat and the download starts as soon as the first chunk is read.
+
+The list pages stream their export directly (``csv_response``). Exports
+too big for a request (``EXPORTS``) are written to a file by a job worker
+instead (``write_export``, see ``ExportJob`` and ``tasks.py``) and
+deleted ``EXPORT_RETENTION_HOURS`` after they finish (``purge_expired``).
+"""
+import csv
+import gzip
+import io
+import tempfile
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.http import QueryDict, StreamingHttpResponse
+from django.utils import timezone
+
+from . import filters
+from .models import ExportJob
+
+DEFAULT_CHUNK_SIZE = 2000
+RETENTION_HOURS = 24
+
+CATALOGUE_HEADER = ['SKU', 'Name', 'Category', 'Subcategory', 'Qty', 'Reorder Qty', 'Unit Price', 'Rating', 'Hidden']
+INVENTORY_HEADER = ['SKU', 'Name', 'Qty On Hand', 'Reorder Qty', 'Status']
+CUSTOMER_HEADER = ['ID', 'First Name', 'Last Name', 'Email', 'Phone', 'Age', 'Gender', 'Employment Status',
+                   'Occupation', 'Education', 'Household Size', 'Has Children', 'Monthly Income',
+                   'Preferred Category']
+ORDER_ITEM_HEADER = ['Order ID', 'Order Date', 'Status', 'Customer Email', 'SKU', 'Product', 'Qty',
+                     'Unit Price', 'Line Total']
+
+
+def catalogue_rows(products, chunk_size=DEFAULT_CHUNK_SIZE, descriptions=False):
+    columns = [
+        'sku', 'product_name', 'product_subcategory__category__category_name',
+        'product_subcategory__subcategory_name', 'quantity_on_hand', 'reorder_quantity',
+        'unit_price', 'product_rating', 'is_visible',
+    ]
+    if descriptions:
+        columns.append('product_description')
+    for sku, name, category, subcategory, qty, reorder, price, rating, visible, *description in (
+            products.values_list(*columns).iterator(chunk_size=chunk_size)):
+        yield [sku, name, category or '', subcategory or '', qty, reorder, price, rating,
+               'No' if visible else 'Yes', *description]
+
+
+def inventory_rows(products, chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = products.values_list('sku', 'product_name', 'quantity_on_hand', 'reorder_quantity')
+    for sku, name, qty, reorder in rows.iterator(chunk_size=chunk_size):
+        yield [sku, name, qty, reorder, 'LOW' if qty <= reorder else 'OK']
+
+
+def customer_rows(customers, chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = customers.values_list(
+        'id', 'first_name', 'last_name', 'email', 'phone', 'age', 'gender', 'employment_status',
+        'occupation', 'education', 'household_size', 'has_children', 'monthly_income', 'preferred_category',
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield ['' if value is None else value for value in row]
+
+
+def order_item_rows(items, chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = items.values_list(
+        'order_id', 'order__order_date', 'order__order_status', 'order__customer__email',
+        'product_id', 'product__product_name', 'quantity', 'unit_price',
+    )
+    for order_id, day, status, email, sku, name, qty, price in rows.iterator(chunk_size=chunk_size):
+        yield [order_id, day.isoformat(), status, email or '', sku, name, qty, price, qty * price]
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(name, header, rows):
+    """Stream ``rows`` as a CSV attachment named ``<name>_<timestamp>.csv``."""
+    stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    resp = StreamingHttpResponse(csv_lines(header, rows), content_type='text/csv; charset=utf-8')
+    resp['Content-Disposition'] = f'attachment; filename="{name}_{stamp}.csv"'
+    return resp
+
+
+# kind -> what a background export writes and who may request it
+ExportKind = namedtuple('ExportKind', 'label name header rows roles')
+
+EXPORTS = {
+    'catalogue': ExportKind(
+        'Catalogue (with descriptions)', 'products', CATALOGUE_HEADER + ['Description'],
+        lambda params, chunk_size: catalogue_rows(filters.catalogue_products(params), chunk_size, descriptions=True),
+        ('Manager', 'Merchandiser')),
+    'inventory': ExportKind(
+        'Inventory', 'inventory', INVENTORY_HEADER,
+        lambda params, chunk_size: inventory_rows(filters.inventory_products(params), chunk_size),
+        ('Manager', 'Inventory')),
+    'customers': ExportKind(
+        'Customers', 'customers', CUSTOMER_HEADER,
+        lambda params, chunk_size: customer_rows(filters.customers(params), chunk_size),
+        ('Manager', 'Support')),
+    'orders': ExportKind(
+        'Order history', 'orders', ORDER_ITEM_HEADER,
+        lambda params, chunk_size: order_item_rows(filters.order_items(params), chunk_size),
+        ('Manager',)),
+}
+
+
+def write_export(export, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write ``export`` (an ExportJob) to its file; returns the row count.
+
+    The CSV (gzipped when ``export.compress``) is spooled to a temporary
+    file chunk by chunk and then handed to the storage, so neither step
+    holds the whole export in memory.
+    """
+    kind = EXPORTS[export.kind]
+    params = QueryDict(mutable=True)
+    for key, values in export.params.items():
+        params.setlist(key, values)
+
+    count = 0
+    with tempfile.TemporaryFile() as tmp:
+        raw = gzip.GzipFile(fileobj=tmp, mode='wb') if export.compress else tmp
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(kind.header)
+        for row in kind.rows(params, chunk_size):
+            writer.writerow(row)
+            count += 1
+        text.flush()
+        text.detach()
+        if export.compress:
+            raw.close()  # writes the gzip trailer; leaves tmp open
+
+        tmp.seek(0)
+        stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+        suffix = '.csv.gz' if export.compress else '.csv'
+        if export.file:
+            export.file.delete(save=False)
+        export.file.save(f"{kind.name}_{stamp}{suffix}", File(tmp), save=False)
+    return count
+
+
+def retention():
+    """How long a finished background export is kept."""
+    return timedelta(hours=getattr(settings, 'EXPORT_RETENTION_HOURS', RETENTION_HOURS))
+
+
+def expired(export):
+    return export.finished_at is not None and export.finished_at <= timezone.now() - retention()
+
+
+def purge_expired():
+    """Delete finished exports older than ``retention()`` and their files; returns how many."""
+    old = ExportJob.objects.filter(status__in=[ExportJob.DONE, ExportJob.FAILED],
+                                   finished_at__lte=timezone.now() - retention())
+    count = 0
+    for export in old.iterator():
+        export.file.delete(save=False)
+        export.delete()
+        count += 1
+    return count
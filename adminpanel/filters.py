@@ -0,0 +1,167 @@
+"""Queryset filters shared by the admin list pages and their CSV exports.
+
+Each function takes the request's query parameters (``request.GET``) so a
+list page and its export link always select the same rows.
+"""
+from datetime import date
+
+from django.db.models import F, Q
+
+from onlineshopfront.models import Customer, OrderItem, Product
+
+PRODUCT_SORTS = {
+    'sku_asc': 'sku',
+    'sku_desc': '-sku',
+    'name_asc': 'product_name',
+    'name_desc': '-product_name',
+}
+
+
+def product_ordering(sort):
+    return PRODUCT_SORTS.get((sort or '').strip(), 'sku')
+
+
+def catalogue_products(params):
+    """Products matching the catalogue page's search, category, subcategory
+    and visibility filters, in its sort order."""
+    qs = Product.objects.all()
+
+    q = (params.get('q') or '').strip()
+    if q:
+        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
+
+    category_ids = params.getlist('categories')
+    if category_ids:
+        qs = qs.filter(category_id__in=category_ids)
+
+    subcategory_ids = params.getlist('subcategories')
+    if subcategory_ids:
+        qs = qs.filter(product_subcategory_id__in=subcategory_ids)
+
+    # visibility logic: values 'visible', 'hidden'; both (or none) means all
+    vis = set(params.getlist('visibility'))
+    if vis and vis != {'visible', 'hidden'}:
+        if vis == {'hidden'}:
+            qs = qs.filter(is_visible=False)
+        elif vis == {'visible'}:
+            qs = qs.filter(is_visible=True)
+
+    return qs.order_by(product_ordering(params.get('sort')))
+
+
+def inventory_products(params):
+    """Products matching the inventory page's search and low-stock filters."""
+    qs = Product.objects.all()
+
+    q = (params.get('q') or '').strip()
+    if q:
+        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
+
+    if params.get('low') == '1':
+        qs = qs.filter(quantity_on_hand__lte=F('reorder_quantity'))
+
+    return qs.order_by(product_ordering(params.get('sort')))
+
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+AGE_RANGES = [
+    ('15-20', 15, 20),
+    ('20-30', 20, 30),
+    ('30-40', 30, 40),
+    ('40-50', 40, 50),
+    ('50-60', 50, 60),
+    ('60+', 60, None),
+]
+INCOME_RANGES = [
+    ('0-2000', 0, 2000),
+    ('2000-5000', 2000, 5000),
+    ('5000-10000', 5000, 10000),
+    ('10000-20000', 10000, 20000),
+    ('20000+', 20000, None),
+]
+
+
+def _ranges_q(field, ranges, selected):
+    range_q = Q()
+    for label, lo, hi in ranges:
+        if label in selected:
+            if hi is None:
+                range_q |= Q(**{f'{field}__gte': lo})
+            else:
+                # inclusive lower, exclusive upper to avoid overlap
+                range_q |= Q(**{f'{field}__gte': lo, f'{field}__lt': hi})
+    return range_q
+
+
+def _ints(values):
+    ints = []
+    for v in values:
+        try:
+            ints.append(int(v))
+        except ValueError:
+            pass
+    return ints
+
+
+def customers(params):
+    """Customers matching the customer page's search and facet filters."""
+    qs = Customer.objects.all().order_by('id')
+    if Customer.objects.count() >= 101:
+        qs = qs.filter(id__gte=101)
+
+    q = (params.get('q') or '').strip()
+    if q:
+        qs = qs.filter(
+            Q(first_name__icontains=q) |
+            Q(last_name__icontains=q) |
+            Q(email__icontains=q) |
+            Q(phone__icontains=q) |
+            Q(occupation__icontains=q) |
+            Q(education__icontains=q) |
+            Q(preferred_category__icontains=q)
+        )
+
+    for param, field in (('gender', 'gender'),
+                         ('employment', 'employment_status'),
+                         ('occupation', 'occupation'),
+                         ('education', 'education'),
+                         ('preferred_category', 'preferred_category')):
+        selected = params.getlist(param)
+        if selected:
+            qs = qs.filter(**{f'{field}__in': selected})
+
+    household = _ints(params.getlist('household_size'))
+    if household:
+        qs = qs.filter(household_size__in=household)
+    children = [int(v) for v in params.getlist('children') if v in ('0', '1')]
+    if children:
+        qs = qs.filter(has_children__in=children)
+
+    age_q = _ranges_q('age', AGE_RANGES, params.getlist('age'))
+    if age_q:
+        qs = qs.filter(age_q)
+    income_q = _ranges_q('monthly_income', INCOME_RANGES, params.getlist('income'))
+    if income_q:
+        qs = qs.filter(income_q)
+    return qs
+
+
+def _date_param(params, name):
+    try:
+        return date.fromisoformat(params.get(name) or '')
+    except ValueError:
+        return None
+
+
+def order_items(params):
+    """Order lines in the dashboard's date range (``start``/``end``) and
+    ``category``; missing or malformed bounds are left open."""
+    qs = OrderItem.objects.order_by('order__order_date', 'order_id', 'product_id')
+    start, end = _date_param(params, 'start'), _date_param(params, 'end')
+    if start:
+        qs = qs.filter(order__order_date__gte=start)
+    if end:
+        qs = qs.filter(order__order_date__lte=end)
+    if params.get('category'):
+        qs = qs.filter(product__category_id=params.get('category'))
+    return qs
@@ -19,14 +19,15 @@ class SubCategoryChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
         return f"{obj.category.category_name} — {obj.subcategory_name}"
 
-_HAS_CATEGORY_FIELD = any(f.name == 'category' for f in Product._meta.fields)
-
 class ProductForm(forms.ModelForm):
     product_subcategory = SubCategoryChoiceField(queryset=SubCategory.objects.none(), empty_label="Select…")
 
     class Meta:
         model = Product
-        exclude = ['category'] if _HAS_CATEGORY_FIELD else []
+        # category follows the subcategory (see Product.save), visibility
+        # only changes through HiddenProduct (see adminpanel.signals) and
+        # quantity_reserved only through onlineshopfront.reservations
+        exclude = ['category', 'is_visible', 'quantity_reserved']
         widgets = {
             'product_description': forms.Textarea(attrs={'rows': 3}),
         }
@@ -37,16 +38,6 @@ class ProductForm(forms.ModelForm):
             SubCategory.objects.select_related('category')
             .order_by('category__category_name', 'subcategory_name')
         )
-
-    def save(self, commit=True):
-        instance = super().save(commit=False)
-        # If the model has a separate 'category' FK, sync it from the chosen subcategory
-        if _HAS_CATEGORY_FIELD and instance.product_subcategory_id:
-            instance.category = instance.product_subcategory.category
-        if commit:
-            instance.save()
-            self.save_m2m()
-        return instance
          
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from onlineshopfront.models import Order
+from adminpanel import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard's daily sales rollups from order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day (YYYY-MM-DD); defaults to the first order")
+        parser.add_argument("--end", help="Last day (YYYY-MM-DD); defaults to the latest order")
+        parser.add_argument("--days", type=int, default=31, help="Days rebuilt per transaction")
+
+    def _date(self, value, option):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"--{option} must be YYYY-MM-DD, got {value!r}")
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('order_date'), last=Max('order_date'))
+        start = self._date(options["start"], "start") if options["start"] else bounds['first']
+        end = self._date(options["end"], "end") if options["end"] else bounds['last']
+        if start is None or end is None:
+            self.stdout.write("No orders to roll up")
+            return
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1")
+
+        rows = 0
+        day = start
+        while day <= end:
+            last = min(day + timedelta(days=options["days"] - 1), end)
+            rows += rollups.rebuild(day, last)
+            day = last + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups for {start} to {end} ({rows} rows)"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0002_default_superuser'),
+        ('onlineshopfront', '0009_alter_order_order_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_orders', to='onlineshopfront.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'category'], name='order_rollup_date_category')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0.0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='onlineshopfront.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='onlineshopfront.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'date'], name='sales_rollup_category_date')],
+                'unique_together': {('date', 'product')},
+            },
+        ),
+    ]
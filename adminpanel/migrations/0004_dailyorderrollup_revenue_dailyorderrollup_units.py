@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0003_dailyorderrollup_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyorderrollup',
+            name='revenue',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='dailyorderrollup',
+            name='units',
+            field=models.IntegerField(default=0),
+        ),
+    ]
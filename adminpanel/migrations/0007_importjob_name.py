@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0006_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to='imports/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:43
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_rows(apps, schema_editor):
+    # keep the newest row of each day and category; ``manage.py
+    # backfill_sales_rollups`` recomputes them if in doubt
+    DailyOrderRollup = apps.get_model('adminpanel', 'DailyOrderRollup')
+    keep = (DailyOrderRollup.objects.values('date', 'category').annotate(last=Max('pk')).order_by()
+            .values_list('last', flat=True))
+    DailyOrderRollup.objects.exclude(pk__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0007_importjob_name'),
+        ('onlineshopfront', '0009_alter_order_order_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyorderrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('date', 'category'), name='order_rollup_unique_category_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyorderrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('date',), name='order_rollup_unique_overall_day'),
+        ),
+    ]
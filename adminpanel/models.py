@@ -1,3 +1,6 @@
+import os
+
+from django.conf import settings
 from django.db import models
 from onlineshopfront.models import Product
 
@@ -6,4 +9,161 @@ class HiddenProduct(models.Model):
     hidden_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Hidden: {self.product.sku}"
\ No newline at end of file
+        return f"Hidden: {self.product.sku}"
+
+
+class DailySalesRollup(models.Model):
+    """Units and revenue sold per product per day, for the dashboard.
+
+    Maintained by ``rollups.py`` from the orders' line items; ``category``
+    is the product's category when the row was last computed.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey('onlineshopfront.Category', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('date', 'product')
+        indexes = [
+            models.Index(fields=['category', 'date'], name='sales_rollup_category_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id}: {self.units}"
+
+
+class DailyOrderRollup(models.Model):
+    """Orders, units and revenue per day, overall (``category`` NULL) and
+    per category, so the dashboard totals are one aggregate.
+
+    An order with items in several categories counts once in each of them
+    and once overall, so these counts can't be derived by summing
+    ``DailySalesRollup``.
+    """
+    date = models.DateField()
+    category = models.ForeignKey('onlineshopfront.Category', on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='daily_orders')
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'category'], name='order_rollup_date_category'),
+        ]
+        # one row per day and category, and one overall row per day (NULLs
+        # never clash in a plain unique constraint)
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], condition=models.Q(category__isnull=False),
+                                    name='order_rollup_unique_category_day'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(category__isnull=True),
+                                    name='order_rollup_unique_overall_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id or 'all'}: {self.order_count}"
+
+
+class ExportJob(models.Model):
+    """A CSV export written in the background by a job worker.
+
+    ``params`` holds the list page's filters (query parameters as lists);
+    the finished file lives under ``MEDIA_ROOT/exports`` and is served by
+    ``views.export_download``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20)
+    params = models.JSONField(default=dict, blank=True)
+    compress = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS, default=QUEUED)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='export_jobs')
+    file = models.FileField(upload_to='exports/', blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} export #{self.pk} ({self.status})"
+
+    @property
+    def pending(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    @property
+    def file_name(self):
+        return os.path.basename(self.file.name) if self.file else ''
+
+
+class ImportJob(models.Model):
+    """A bulk product upload (CSV) imported in the background by a job worker.
+
+    The worker reads the stored file a chunk of rows at a time and commits
+    each chunk together with the progress fields (``offset``,
+    ``rows_processed`` and the counts), so an interrupted import carries on
+    after its last committed chunk. See ``uploads.import_file``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # the stored upload is deleted once the import is done or has failed
+    file = models.FileField(upload_to='imports/', blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    update_existing = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS, default=QUEUED)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='import_jobs')
+    size = models.PositiveBigIntegerField(default=0)
+    header = models.JSONField(default=list, blank=True)
+    # bytes of the file imported and committed so far, header included
+    offset = models.PositiveBigIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # the first row problems ("Line N: ..."); error_count has the total
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"product import #{self.pk} ({self.status})"
+
+    @property
+    def pending(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        return int(self.offset * 100 / self.size) if self.size else 0
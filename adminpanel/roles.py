@@ -0,0 +1,53 @@
+"""Cached lookup of a staff user's role (auth group) names.
+
+``groups_required`` and the ``role_flags`` context processor both need the
+user's groups on every admin request. The names are cached per user under a
+global role version: changing a user's groups drops that user's entry, and
+renaming or deleting a group bumps the version for everyone (see
+``signals.py``). The result is also memoised on the user object so one
+request reads the cache at most once.
+"""
+from time import time_ns
+
+from django.core.cache import cache
+
+ROLE_VERSION_KEY = 'adminpanel:roles:version'
+ROLE_CACHE_KEY = 'adminpanel:roles:{version}:{user_id}'
+ROLE_CACHE_TIMEOUT = 60 * 60
+
+
+def _role_version():
+    return cache.get_or_set(ROLE_VERSION_KEY, time_ns, None)
+
+
+def role_names(user):
+    """Return the user's group names as a frozenset."""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, '_role_names', None)
+    if names is None:
+        key = ROLE_CACHE_KEY.format(version=_role_version(), user_id=user.pk)
+        names = cache.get(key)
+        if names is None:
+            names = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, names, ROLE_CACHE_TIMEOUT)
+        user._role_names = names
+    return names
+
+
+def has_role(user, *names):
+    """Whether ``user`` is an admin (superuser or Admin group) or has any of ``names``."""
+    if not user.is_authenticated:
+        return False
+    user_roles = role_names(user)
+    if user.is_superuser or 'Admin' in user_roles:
+        return True
+    return not user_roles.isdisjoint(names)
+
+
+def forget_role_names(user_id):
+    cache.delete(ROLE_CACHE_KEY.format(version=_role_version(), user_id=user_id))
+
+
+def bump_role_version():
+    cache.set(ROLE_VERSION_KEY, time_ns(), None)
@@ -0,0 +1,126 @@
+"""Daily sales rollups behind the admin dashboard.
+
+The dashboard sums ``DailySalesRollup`` and ``DailyOrderRollup`` rows
+instead of scanning every order line in the requested range, so a year
+costs about what a day does. After checkout a job (queued by
+``signals.py``) recomputes the rows for the order's day and SKUs from
+``OrderItem``; recomputing rather than incrementing makes a job that runs
+twice harmless. ``manage.py backfill_sales_rollups`` rebuilds whole date
+ranges, e.g. for existing history or after products changed category.
+Every refresh bumps the sales version the dashboard caches under.
+"""
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+
+from onlineshopfront.models import Order, OrderItem, Product
+from .models import DailyOrderRollup, DailySalesRollup
+
+SALES_VERSION_KEY = 'adminpanel:sales:version'
+
+
+def sales_version():
+    return cache.get_or_set(SALES_VERSION_KEY, time_ns, None)
+
+
+def bump_sales_version():
+    cache.set(SALES_VERSION_KEY, time_ns(), None)
+
+
+def _line_totals():
+    return {'units': Sum('quantity'),
+            'revenue': Sum(F('quantity') * F('unit_price'), output_field=FloatField())}
+
+
+def _sales_rows(items):
+    rows = (items.values('order__order_date', 'product_id', 'product__category_id')
+            .annotate(**_line_totals())
+            .order_by())
+    return [
+        DailySalesRollup(date=row['order__order_date'], product_id=row['product_id'],
+                         category_id=row['product__category_id'], units=row['units'], revenue=row['revenue'])
+        for row in rows
+    ]
+
+
+def _order_rows(items, categories=None):
+    """Overall and per-category day totals of ``items``.
+
+    Per-category rows are limited to ``categories`` when given.
+    """
+    overall = (items.values('order__order_date')
+               .annotate(orders=Count('order', distinct=True), **_line_totals()).order_by())
+    categorised = items.filter(product__category__isnull=False)
+    if categories is not None:
+        categorised = categorised.filter(product__category_id__in=categories)
+    per_category = (categorised.values('order__order_date', 'product__category_id')
+                    .annotate(orders=Count('order', distinct=True), **_line_totals()).order_by())
+    return [
+        DailyOrderRollup(date=row['order__order_date'], category_id=row.get('product__category_id'),
+                         order_count=row['orders'], units=row['units'], revenue=row['revenue'])
+        for row in [*overall, *per_category]
+    ]
+
+
+def refresh_order(order_id):
+    """Recompute the rollup rows ``order_id`` contributes to."""
+    day = Order.objects.filter(pk=order_id).values_list('order_date', flat=True).first()
+    if day is None:
+        return
+    with transaction.atomic():
+        skus = list(OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True))
+        categories = set(Product.objects.filter(pk__in=skus, category__isnull=False)
+                         .values_list('category_id', flat=True))
+        day_items = OrderItem.objects.filter(order__order_date=day)
+
+        DailySalesRollup.objects.filter(date=day, product_id__in=skus).delete()
+        DailySalesRollup.objects.bulk_create(_sales_rows(day_items.filter(product_id__in=skus)))
+        DailyOrderRollup.objects.filter(
+            Q(category__isnull=True) | Q(category_id__in=categories), date=day).delete()
+        DailyOrderRollup.objects.bulk_create(_order_rows(day_items, categories))
+        transaction.on_commit(bump_sales_version)
+
+
+def rebuild(start, end, batch_size=1000):
+    """Recompute every rollup row from ``start`` to ``end`` (inclusive).
+
+    Returns the number of sales rows written.
+    """
+    with transaction.atomic():
+        items = OrderItem.objects.filter(order__order_date__gte=start, order__order_date__lte=end)
+        DailySalesRollup.objects.filter(date__gte=start, date__lte=end).delete()
+        DailyOrderRollup.objects.filter(date__gte=start, date__lte=end).delete()
+        sales = DailySalesRollup.objects.bulk_create(_sales_rows(items), batch_size=batch_size)
+        DailyOrderRollup.objects.bulk_create(_order_rows(items), batch_size=batch_size)
+        transaction.on_commit(bump_sales_version)
+    return len(sales)
+
+
+def sales_summary(start, end, category_id=None, top=5):
+    """Revenue, units, order count and top sellers for the dashboard.
+
+    The totals are one aggregate over the day rows, the top sellers one
+    GROUP BY over the per-SKU rows.
+    """
+    days = DailyOrderRollup.objects.filter(date__gte=start, date__lte=end)
+    sales = DailySalesRollup.objects.filter(date__gte=start, date__lte=end)
+    if category_id:
+        days = days.filter(category_id=category_id)
+        sales = sales.filter(category_id=category_id)
+    else:
+        days = days.filter(category__isnull=True)
+
+    totals = days.aggregate(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('order_count'))
+    top_products = list(
+        sales.values('product__sku', 'product__product_name')
+        .annotate(total_qty=Sum('units'))
+        .order_by('-total_qty')[:top]
+    )
+    return {
+        'revenue': totals['revenue'] or 0.0,
+        'units': totals['units'] or 0,
+        'orders': totals['orders'] or 0,
+        'top_products': top_products,
+    }
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from onlineshopfront import caching
+from onlineshopfront.models import Order, Product
+from .models import HiddenProduct
+from . import roles
+
+
+@receiver(post_save, sender=HiddenProduct)
+def hide_product(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(is_visible=False, updated_at=timezone.now())
+    sku = instance.product_id
+    transaction.on_commit(lambda: caching.bump_product_version(sku))
+
+
+@receiver(post_delete, sender=HiddenProduct)
+def unhide_product(sender, instance, **kwargs):
+    # also runs when the product itself is deleted (cascade); the update is
+    # then a no-op
+    Product.objects.filter(pk=instance.product_id).update(is_visible=True, updated_at=timezone.now())
+    sku = instance.product_id
+    transaction.on_commit(lambda: caching.bump_product_version(sku))
+
+
+@receiver(post_save, sender=Order)
+def queue_sales_rollup(sender, instance, created, **kwargs):
+    # the job row commits together with the order (and its items, which
+    # checkout creates right after), so the worker sees the whole order
+    if created:
+        enqueue('adminpanel.refresh_sales_rollup', order_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set is not None:
+        # group.user_set.add(...): instance is the Group, pk_set the users
+        user_ids = pk_set
+    else:
+        # group.user_set.clear() doesn't say which users were affected
+        transaction.on_commit(roles.bump_role_version)
+        return
+    for user_id in user_ids:
+        transaction.on_commit(lambda user_id=user_id: roles.forget_role_names(user_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_all_roles(sender, **kwargs):
+    transaction.on_commit(roles.bump_role_version)
@@ -0,0 +1,104 @@
+"""Background jobs for the admin panel (run by ``manage.py run_workers``)."""
+import csv
+
+from django.conf import settings
+from django.utils import timezone
+
+from jobs.queue import enqueue, register
+from . import exports
+from . import rollups
+from . import uploads
+from .models import ExportJob, ImportJob
+
+
+@register('adminpanel.refresh_sales_rollup')
+def refresh_sales_rollup(order_id):
+    """Fold a newly placed order into the dashboard's daily rollups."""
+    rollups.refresh_order(order_id)
+
+
+def _export_failed(error, export_id):
+    """Record an export whose job gave up, e.g. when its worker died."""
+    ExportJob.objects.filter(pk=export_id, status__in=[ExportJob.QUEUED, ExportJob.RUNNING]).update(
+        status=ExportJob.FAILED, error=error.strip().splitlines()[-1], finished_at=timezone.now())
+
+
+@register('adminpanel.run_export', on_failure=_export_failed)
+def run_export(export_id):
+    """Write a requested background export (see ``exports.write_export``)."""
+    export = ExportJob.objects.filter(pk=export_id).first()
+    # a RUNNING export is being written by another run of this job
+    if export is None or export.status != ExportJob.QUEUED:
+        return
+    export.status = ExportJob.RUNNING
+    export.save(update_fields=['status'])
+    try:
+        export.row_count = exports.write_export(export)
+    except Exception as exc:
+        export.status = ExportJob.FAILED
+        export.error = str(exc)
+        export.finished_at = timezone.now()
+        export.save(update_fields=['status', 'error', 'finished_at'])
+        raise
+    export.status = ExportJob.DONE
+    export.error = ''
+    export.finished_at = timezone.now()
+    export.save(update_fields=['status', 'file', 'row_count', 'error', 'finished_at'])
+    # a second later, so this export's finished_at is past the cutoff
+    enqueue('adminpanel.purge_exports', delay=exports.retention().total_seconds() + 1)
+
+
+@register('adminpanel.purge_exports')
+def purge_exports():
+    """Delete expired background exports (see ``exports.purge_expired``)."""
+    exports.purge_expired()
+
+
+def _finish_import(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    # the upload isn't needed any more; the job keeps the counts and errors
+    job.file.delete(save=False)
+    job.save(update_fields=['status', 'error', 'finished_at', 'file'])
+
+
+def _import_failed(error, import_id):
+    """Record an import whose job gave up (see ``jobs.queue.register``)."""
+    job = ImportJob.objects.filter(pk=import_id).first()
+    if job is not None and job.pending:
+        # error is the traceback; its last line names the exception
+        line = job.rows_processed + 2
+        _finish_import(job, ImportJob.FAILED, f"Line {line} onwards: {error.strip().splitlines()[-1]}")
+
+
+@register('adminpanel.run_import', on_failure=_import_failed)
+def run_import(import_id):
+    """Import the next slice of a bulk product upload.
+
+    Queues itself again until the file is done, so a long import neither
+    outlives the job lease nor keeps other jobs waiting.
+    """
+    job = ImportJob.objects.filter(pk=import_id).first()
+    if job is None or not job.pending:
+        return
+    if job.status == ImportJob.QUEUED:
+        job.status = ImportJob.RUNNING
+        job.save(update_fields=['status'])
+    try:
+        finished = uploads.import_file(
+            job,
+            chunk_size=getattr(settings, 'PRODUCT_IMPORT_CHUNK_ROWS', uploads.CHUNK_ROWS),
+            time_limit=getattr(settings, 'PRODUCT_IMPORT_SLICE_SECONDS', uploads.SLICE_SECONDS),
+        )
+    except (UnicodeDecodeError, csv.Error) as exc:
+        # the rest of the file can't be read; earlier chunks stay imported
+        line = job.rows_processed + 2
+        _finish_import(job, ImportJob.FAILED,
+                       f"File must be UTF-8 encoded (line {line} onwards)." if isinstance(exc, UnicodeDecodeError)
+                       else f"Line {line} onwards: {exc}")
+        return
+    if finished:
+        _finish_import(job, ImportJob.DONE)
+    else:
+        enqueue('adminpanel.run_import', import_id=job.pk)
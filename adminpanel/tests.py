@@ -1,3 +1,375 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim, work
+from onlineshopfront import caching
+from onlineshopfront.models import Order, OrderItem, Product
+from onlineshopfront.testing import make_customer, make_product, make_subcategory
+from .models import DailyOrderRollup, DailySalesRollup, ExportJob, HiddenProduct, ImportJob
+from .roles import forget_role_names
+from .rollups import refresh_order
+from .tasks import run_export
+from .uploads import import_rows
+
+
+class RoleCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'pw')
+        self.staff = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.staff.groups.add(Group.objects.create(name='Support'))
+
+    def test_staff_edit_role_change_takes_effect(self):
+        catalogue = reverse('adminpanel:catalogue_list')
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(catalogue).status_code, 302)
+
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('adminpanel:staff_edit', args=[self.staff.pk]), {
+                'first_name': 'Cle', 'last_name': 'Rk', 'email': 'clerk@example.com', 'role': 'Manager',
+            })
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(catalogue).status_code, 200)
+
+
+class ProductFormTests(TestCase):
+    def setUp(self):
+        self.product = make_product('BK-1')
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'pw'))
+
+    def _edit(self, **extra):
+        self.client.post(reverse('adminpanel:product_edit', args=['BK-1']), {
+            'sku': 'BK-1', 'product_name': 'Renamed', 'product_description': 'x', 'product_category': 'Books',
+            'quantity_on_hand': 5, 'reorder_quantity': 1, 'unit_price': 10.0, 'product_rating': 4.0,
+            'product_subcategory': self.product.product_subcategory_id, **extra,
+        })
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_name, 'Renamed')
+
+    def test_product_edit_leaves_visibility_to_hidden_products(self):
+        HiddenProduct.objects.create(product=self.product)
+        self._edit(is_visible='on')
+        self.assertFalse(self.product.is_visible)
+
+    def test_product_edit_leaves_reserved_stock_alone(self):
+        # a reservation made while the form was open
+        Product.objects.filter(pk='BK-1').update(quantity_reserved=3)
+        self._edit(quantity_reserved=0)
+        self.assertEqual(self.product.quantity_reserved, 3)
+
+    def test_product_edit_moves_category_with_subcategory(self):
+        toys = make_subcategory('Toys', 'Puzzles')
+        self._edit(product_subcategory=toys.pk)
+        self.assertEqual(self.product.category, toys.category)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        books, toys = make_subcategory('Books', 'Books'), make_subcategory('Toys', 'Toys')
+        self.books = books.category
+        for sku, sub in (('BK-1', books), ('BK-2', books), ('TY-1', toys)):
+            make_product(sku, sub, product_name=f'Product {sku}', quantity_on_hand=50)
+        self.customer = make_customer()
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'pw')
+
+    def _order(self, day, **lines):
+        order = Order.objects.create(order_status='Order Placed', order_date=day, required_date=day,
+                                     customer=self.customer)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=sku.replace('_', '-'), quantity=qty, unit_price=price)
+            for sku, (qty, price) in lines.items()
+        ])
+        return order
+
+    def _dashboard(self, start, end, category=''):
+        self.client.force_login(self.admin)
+        resp = self.client.get(reverse('adminpanel:adminpanel'),
+                               {'start': start.isoformat(), 'end': end.isoformat(), 'category': category})
+        return {key: resp.context[key] for key in ('sales_revenue', 'units_sold', 'orders_count', 'top_products')}
+
+    def test_checkout_jobs_and_backfill_agree_with_order_history(self):
+        day1, day2 = date(2026, 3, 1), date(2026, 3, 2)
+        self._order(day1, BK_1=(2, 10.0), TY_1=(1, 5.0))
+        self._order(day1, BK_1=(1, 10.0), BK_2=(4, 2.5))
+        self._order(day2, TY_1=(3, 5.0))
+        self.assertEqual(work('test', once=True), 3)
+        # a retried job recomputes rather than double counting
+        refresh_order(Order.objects.first().pk)
+
+        everything = self._dashboard(day1, day2)
+        self.assertEqual(everything['sales_revenue'], 60.0)
+        self.assertEqual(everything['units_sold'], 11)
+        self.assertEqual(everything['orders_count'], 3)
+        self.assertEqual(everything['top_products'][0],
+                         {'product__sku': 'BK-2', 'product__product_name': 'Product BK-2', 'total_qty': 4})
+        books = self._dashboard(day1, day2, self.books.pk)
+        self.assertEqual((books['sales_revenue'], books['units_sold'], books['orders_count']), (40.0, 7, 2))
+        self.assertEqual(self._dashboard(day2, day2)['orders_count'], 1)
+
+        incremental = set(DailySalesRollup.objects.values_list('date', 'product_id', 'units', 'revenue'))
+        DailySalesRollup.objects.all().delete()
+        call_command('backfill_sales_rollups', days=1, stdout=io.StringIO())
+        self.assertEqual(set(DailySalesRollup.objects.values_list('date', 'product_id', 'units', 'revenue')),
+                         incremental)
+        self.assertEqual(self._dashboard(day1, day2, self.books.pk), books)
+
+    def test_one_order_rollup_row_per_day_and_category(self):
+        day = date(2025, 1, 1)
+        DailyOrderRollup.objects.create(date=day)
+        DailyOrderRollup.objects.create(date=day, category=self.books)
+        for category in (None, self.books):
+            with self.subTest(category=category), self.assertRaises(IntegrityError), transaction.atomic():
+                DailyOrderRollup.objects.create(date=day, category=category)
+
+    def test_dashboard_kpis_are_cached_until_stock_or_sales_change(self):
+        day = date(2026, 3, 1)
+        self.assertEqual(self._dashboard(day, day)['orders_count'], 0)
+        url = reverse('adminpanel:adminpanel') + f'?start={day}&end={day}'
+        with self.assertNumQueries(2):  # session and user; KPIs and categories come from the cache
+            self.client.get(url)
+
+        self._order(day, BK_1=(2, 10.0))
+        with self.captureOnCommitCallbacks(execute=True):
+            work('test', once=True)
+        self.assertEqual(self._dashboard(day, day)['units_sold'], 2)
+
+        product = Product.objects.get(pk='BK-1')
+        product.quantity_on_hand = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.client.force_login(self.admin)
+        resp = self.client.get(reverse('adminpanel:adminpanel'))
+        self.assertEqual((resp.context['total_units'], resp.context['low_stock_count']), (100, 1))
+
+
+class CsvExportTests(TestCase):
+    def setUp(self):
+        sub = make_subcategory()
+        for i, qty in enumerate((0, 5, 50)):
+            make_product(f'BK-{i}', sub, product_name=f'Book {i}', product_description='x', quantity_on_hand=qty,
+                         reorder_quantity=5, is_visible=i != 1)
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'pw'))
+
+    def _rows(self, resp):
+        self.assertTrue(resp.streaming)
+        return list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode())))
+
+    def test_catalogue_export_streams_the_filtered_list(self):
+        resp = self.client.get(reverse('adminpanel:catalogue_export'), {'visibility': 'hidden'})
+        self.assertEqual(self._rows(resp), [
+            ['SKU', 'Name', 'Category', 'Subcategory', 'Qty', 'Reorder Qty', 'Unit Price', 'Rating', 'Hidden'],
+            ['BK-1', 'Book 1', 'Books', 'Fiction', '5', '5', '10.0', '4.0', 'Yes'],
+        ])
+
+    def test_inventory_export_streams_low_stock(self):
+        resp = self.client.get(reverse('adminpanel:inventory_export'), {'low': '1', 'sort': 'sku_desc'})
+        self.assertEqual([row[0] for row in self._rows(resp)], ['SKU', 'BK-1', 'BK-0'])
+        self.assertTrue(resp['Content-Disposition'].startswith('attachment; filename="inventory_'))
+
+
+class BackgroundExportTests(CsvExportTests):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _export(self, kind, query='', **post):
+        resp = self.client.post(reverse('adminpanel:export_start', args=[kind]) + query, post)
+        self.assertRedirects(resp, reverse('adminpanel:export_list'))
+        self.assertEqual(work('test', once=True), 1)
+        return ExportJob.objects.get()
+
+    def test_worker_writes_the_filtered_export_for_download(self):
+        export = self._export('catalogue', '?visibility=hidden&page=3')
+        self.assertEqual((export.status, export.row_count), ('done', 1))
+        self.assertEqual(export.params, {'visibility': ['hidden']})
+        self.assertContains(self.client.get(reverse('adminpanel:export_list')), export.file_name)
+
+        resp = self.client.get(reverse('adminpanel:export_download', args=[export.pk]))
+        self.assertTrue(resp['Content-Disposition'].startswith('attachment; filename="products_'))
+        rows = list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode())))
+        self.assertEqual(rows[1], ['BK-1', 'Book 1', 'Books', 'Fiction', '5', '5', '10.0', '4.0', 'Yes', 'x'])
+
+    def test_gzipped_export_and_access_control(self):
+        export = self._export('inventory', '?low=1', gzip='1')
+        self.assertTrue(export.file_name.endswith('.csv.gz'))
+        with export.file.open('rb') as f:
+            lines = gzip.decompress(f.read()).decode().splitlines()
+        self.assertEqual(lines, ['SKU,Name,Qty On Hand,Reorder Qty,Status', 'BK-0,Book 0,0,5,LOW', 'BK-1,Book 1,5,5,LOW'])
+
+        support = User.objects.create_user('helper', 'helper@example.com', 'pw', is_staff=True)
+        support.groups.add(Group.objects.create(name='Support'))
+        self.client.force_login(support)
+        self.assertEqual(self.client.post(reverse('adminpanel:export_start', args=['inventory'])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('adminpanel:export_download', args=[export.pk])).status_code, 403)
+        self.assertEqual(self.client.post(reverse('adminpanel:export_start', args=['nope'])).status_code, 404)
+
+    def test_export_left_running_is_failed_not_written_twice(self):
+        self.client.post(reverse('adminpanel:export_start', args=['inventory']))
+        export = ExportJob.objects.get()
+        # a worker took the job and died while writing the file
+        claim('gone')
+        ExportJob.objects.update(status=ExportJob.RUNNING)
+        run_export(export.pk)
+        self.assertFalse(ExportJob.objects.get().file)
+
+        Job.objects.update(locked_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(work('test', once=True), 0)
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.error, export.file.name),
+                         ('failed', 'Lease expired while running on gone.', ''))
+
+    def test_download_needs_the_role_still(self):
+        clerk = User.objects.create_user('stock', 'stock@example.com', 'pw', is_staff=True)
+        clerk.groups.add(Group.objects.create(name='Inventory'))
+        self.client.force_login(clerk)
+        export = self._export('inventory')
+        download = reverse('adminpanel:export_download', args=[export.pk])
+        self.assertEqual(self.client.get(download).status_code, 200)
+        clerk.groups.clear()
+        forget_role_names(clerk.pk)
+        self.assertEqual(self.client.get(download).status_code, 403)
+
+    def test_expired_exports_are_deleted(self):
+        export = self._export('inventory')
+        path = export.file.path
+        purge = Job.objects.get(name='adminpanel.purge_exports', status=Job.QUEUED)
+        self.assertGreater(purge.run_after, timezone.now() + timedelta(hours=23))
+
+        ExportJob.objects.update(finished_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(self.client.get(reverse('adminpanel:export_download', args=[export.pk])).status_code, 404)
+        Job.objects.filter(pk=purge.pk).update(run_after=timezone.now())
+        self.assertEqual(work('test', once=True), 1)
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class BulkUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        make_product('BK-1', product_name='Old name', product_description='kept', quantity_on_hand=1,
+                     unit_price=1.0, product_rating=1.0)
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'pw'))
+
+    def _upload(self, text, update_existing=False):
+        data = {'file': SimpleUploadedFile('products.csv', text.encode())}
+        if update_existing:
+            data['update_existing'] = 'on'
+        resp = self.client.post(reverse('adminpanel:bulk_products_upload'), data)
+        job = ImportJob.objects.latest('pk')
+        self.assertRedirects(resp, reverse('adminpanel:bulk_upload_progress', args=[job.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            work('test', once=True)
+        job.refresh_from_db()
+        return job
+
+    def test_rows_are_validated_and_applied_in_bulk(self):
+        version = caching.catalog_version()
+        rows = ''.join(f'NEW-{i},New {i},Toys,Puzzles,,{i},2.50,,,{"yes" if i == 0 else "no"}\n' for i in range(50))
+        csv_text = ('sku,name,category,subcategory,description,qty,price,reorder_qty,rating,hidden\n'
+                    + rows
+                    + 'BK-1,New name,books,fiction,,7,9.99,x,,true\n'
+                    + ',No sku,Books,,,1,1,,,\n'
+                    + 'BAD-1,Bad,Books,Fiction,,lots,1,,,\n'
+                    + 'NOSUB,No sub,Books,,,1,1,,,\n')
+        with self.assertNumQueries(10), self.captureOnCommitCallbacks(execute=True):
+            created, updated, errors = import_rows(csv.DictReader(io.StringIO(csv_text)), True)
+        self.assertEqual((created, updated), (50, 1))
+        self.assertEqual(errors, ["Line 52: bad reorder_qty 'x' (using 0)", "Line 53: missing sku or name",
+                                  "Line 54: bad qty 'lots'", "Line 55: create failed (subcategory required)"])
+
+        new = Product.objects.select_related('product_subcategory').get(pk='NEW-3')
+        self.assertEqual((new.product_subcategory.subcategory_name, new.category.category_name, new.unit_price),
+                         ('Puzzles', 'Toys', 2.5))
+        self.assertFalse(Product.objects.get(pk='NEW-0').is_visible)
+        self.assertTrue(Product.objects.get(pk='NEW-0').hidden_flag)
+        updated = Product.objects.get(pk='BK-1')
+        self.assertEqual((updated.product_name, updated.product_description, updated.quantity_on_hand),
+                         ('New name', 'kept', 7))
+        self.assertFalse(updated.is_visible)
+        self.assertNotEqual(caching.catalog_version(), version)
+
+    def test_queries_grow_per_batch_not_per_row(self):
+        def queries(prefix, count):
+            rows = ''.join(f'{prefix}-{i},New,Books,Fiction,1,1\n' for i in range(count))
+            with CaptureQueriesContext(connection) as ctx:
+                import_rows(csv.DictReader(io.StringIO('sku,name,category,subcategory,qty,price\n' + rows)),
+                            False, batch_size=10)
+            return len(ctx)
+
+        # each further batch_size rows add one INSERT (SQLite may split a
+        # batch further to stay under its variable limit)
+        ten = queries('A', 10)
+        self.assertEqual(queries('B', 20), ten + 1)
+        self.assertEqual(queries('C', 40), ten + 3)
+
+    def test_upload_is_imported_by_the_worker_in_chunks(self):
+        job = self._upload('sku,name,category,qty,price,hidden\nBK-1,Again,Books,1,1,no\n')
+        self.assertEqual((job.status, job.created_count, job.error_count), ('done', 0, 1))
+        self.assertContains(self.client.get(reverse('adminpanel:bulk_upload_progress', args=[job.pk])),
+                            "Line 2: SKU &#x27;BK-1&#x27; exists (skipped)")
+
+        # one chunk per slice: each run picks up after the last committed chunk
+        text = ('\ufeffSKU,Name,Category,Subcategory,Qty,Price\n'
+                + ''.join(f'NEW-{i},"New\n{i} ü",Books,Fiction,{i},1\n' for i in range(5))
+                + 'BK-1,Updated,Books,,3,2\n')
+        with self.settings(PRODUCT_IMPORT_CHUNK_ROWS=2, PRODUCT_IMPORT_SLICE_SECONDS=0):
+            job = self._upload(text, update_existing=True)
+        self.assertEqual((job.status, job.rows_processed, job.created_count, job.updated_count, job.percent),
+                         ('done', 6, 5, 1, 100))
+        self.assertEqual(job.offset, job.size)
+        self.assertEqual((job.name, job.file.name), ('products.csv', ''))
+        self.assertEqual(os.listdir(os.path.join(django_settings.MEDIA_ROOT, 'imports')), [])
+        self.assertEqual(Product.objects.get(pk='NEW-4').product_name, 'New\n4 ü')
+        self.assertEqual(Product.objects.get(pk='BK-1').quantity_on_hand, 3)
+        self.assertTrue(Product.objects.get(pk='BK-1').is_visible)
+
+    def test_import_is_failed_when_its_job_gives_up(self):
+        self.client.post(reverse('adminpanel:bulk_products_upload'),
+                         {'file': SimpleUploadedFile('products.csv', b'sku,name,category,qty,price\nA,B,Books,1,1\n')})
+        job = ImportJob.objects.get()
+        # an error other than a malformed file, on the job's last attempt
+        Job.objects.update(max_attempts=1)
+        with mock.patch('adminpanel.uploads.import_file', side_effect=OSError('disk gone')):
+            work('test', once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.file.name), ('failed', 'Line 2 onwards: OSError: disk gone', ''))
+        self.assertEqual(os.listdir(os.path.join(django_settings.MEDIA_ROOT, 'imports')), [])
+        self.assertContains(self.client.get(reverse('adminpanel:bulk_upload_progress', args=[job.pk])),
+                            'Import stopped: Line 2 onwards: OSError: disk gone')
 
-# Create your tests here.
+    def test_bad_header_is_reported_before_queueing(self):
+        resp = self.client.post(reverse('adminpanel:bulk_products_upload'),
+                                {'file': SimpleUploadedFile('p.csv', b'sku,name\nA,B\n')})
+        self.assertRedirects(resp, reverse('adminpanel:bulk_products_upload'))
+        self.assertEqual([str(m) for m in resp.wsgi_request._messages],
+                         ['Missing required columns: category, price, qty'])
+        self.assertFalse(ImportJob.objects.exists())
@@ -0,0 +1,284 @@
+"""Bulk product upload from CSV (``views.bulk_products_upload``).
+
+All rows are parsed and validated first. Then the categories,
+subcategories and existing products the file mentions are loaded with one
+query each, missing categories and subcategories are created, and the
+products are written with batched inserts (new SKUs) and upserts
+(existing SKUs), so an upload costs a few queries per thousand rows rather
+than several per row.
+
+bulk_create skips ``Product.save()`` and the model signals, so
+``category``, ``updated_at`` and ``is_visible`` are set here and the cache
+versions are bumped once the upload commits.
+
+Uploads are imported in the background (``ImportJob``, ``tasks.py``):
+``import_file`` streams the stored file and applies it a chunk of rows per
+transaction, so memory stays bounded whatever the file size.
+"""
+import csv
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from onlineshopfront import caching
+from onlineshopfront.models import Category, Product, SubCategory
+from .models import HiddenProduct
+
+REQUIRED_COLUMNS = {'sku', 'name', 'category', 'qty', 'price'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+BATCH_SIZE = 1000
+CHUNK_ROWS = 5000
+SLICE_SECONDS = 60
+MAX_STORED_ERRORS = 200
+
+# hidden is None when the file has no hidden column
+ProductRow = namedtuple('ProductRow', 'line sku name category subcategory description qty price reorder_qty '
+                                      'rating hidden')
+
+UPDATE_FIELDS = ['product_name', 'product_category', 'product_subcategory', 'category', 'product_description',
+                 'quantity_on_hand', 'reorder_quantity', 'unit_price', 'product_rating', 'is_visible',
+                 'updated_at']
+
+
+def missing_columns(fieldnames):
+    return REQUIRED_COLUMNS - {h.lower() for h in fieldnames if h}
+
+
+def parse_row(line_no, row, errors):
+    """Validate one CSV row.
+
+    Returns a ProductRow, or None for a rejected row. Problems are added to
+    ``errors`` as ``(line_no, message)``; a bad reorder_qty or rating only
+    falls back to 0.
+    """
+    # extra cells end up under the None key, missing ones as None values
+    row_l = {k.lower(): (v or '').strip() for k, v in row.items() if k is not None}
+
+    sku = row_l.get('sku')
+    name = row_l.get('name')
+    cat_name = row_l.get('category')
+    qty_raw = row_l.get('qty')
+    price_raw = row_l.get('price')
+    reorder_raw = row_l.get('reorder_qty') or row_l.get('reorder_quantity') or ''
+    rating_raw = row_l.get('rating', '')
+
+    if not sku or not name:
+        errors.append((line_no, f"Line {line_no}: missing sku or name"))
+        return None
+    if not cat_name:
+        errors.append((line_no, f"Line {line_no}: category required"))
+        return None
+
+    try:
+        qty = int(qty_raw)
+    except (TypeError, ValueError):
+        errors.append((line_no, f"Line {line_no}: bad qty '{qty_raw}'"))
+        return None
+
+    try:
+        price = float(Decimal(price_raw))
+    except (TypeError, ValueError, InvalidOperation):
+        errors.append((line_no, f"Line {line_no}: bad price '{price_raw}'"))
+        return None
+
+    try:
+        reorder_qty = int(reorder_raw) if reorder_raw else 0
+    except ValueError:
+        errors.append((line_no, f"Line {line_no}: bad reorder_qty '{reorder_raw}' (using 0)"))
+        reorder_qty = 0
+
+    try:
+        rating = float(rating_raw) if rating_raw else 0.0
+    except ValueError:
+        errors.append((line_no, f"Line {line_no}: bad rating '{rating_raw}' (using 0.0)"))
+        rating = 0.0
+
+    hidden = row_l['hidden'].lower() in TRUE_VALUES if 'hidden' in row_l else None
+    return ProductRow(line_no, sku, name, cat_name, row_l.get('subcategory', ''), row_l.get('description', ''),
+                      qty, price, reorder_qty, rating, hidden)
+
+
+def _categories(rows):
+    """Category per lower-cased name used in ``rows``, creating missing ones."""
+    by_name = {}
+    for category in Category.objects.order_by('pk'):
+        by_name.setdefault(category.category_name.lower(), category)
+    new = {}
+    for row in rows:
+        new.setdefault(row.category.lower(), row.category)
+    new = [Category(category_name=name) for key, name in new.items() if key not in by_name]
+    for category in Category.objects.bulk_create(new):
+        by_name[category.category_name.lower()] = category
+    return by_name, bool(new)
+
+
+def _subcategories(rows, categories):
+    """SubCategory per (category id, lower-cased name) used in ``rows``, creating missing ones."""
+    wanted = {}
+    for row in rows:
+        if row.subcategory:
+            category = categories[row.category.lower()]
+            wanted.setdefault((category.pk, row.subcategory.lower()), (category, row.subcategory))
+    by_key = {}
+    for sub in (SubCategory.objects.filter(category_id__in={pk for pk, _ in wanted}).order_by('pk')):
+        by_key.setdefault((sub.category_id, sub.subcategory_name.lower()), sub)
+    new = [SubCategory(category=category, subcategory_name=name)
+           for key, (category, name) in wanted.items() if key not in by_key]
+    for sub in SubCategory.objects.bulk_create(new):
+        by_key[(sub.category_id, sub.subcategory_name.lower())] = sub
+    return by_key, bool(new)
+
+
+def _assign(product, row, subcat, now):
+    product.product_name = row.name
+    product.product_category = row.category
+    if subcat:
+        product.product_subcategory = subcat
+        product.category_id = subcat.category_id
+    if row.description:
+        product.product_description = row.description
+    product.quantity_on_hand = row.qty
+    product.reorder_quantity = row.reorder_qty
+    product.unit_price = row.price
+    product.product_rating = row.rating
+    product.updated_at = now
+
+
+def _apply(rows, update_existing, errors, batch_size):
+    now = timezone.now()
+    categories, new_categories = _categories(rows)
+    subcategories, new_subcategories = _subcategories(rows, categories)
+    existing = {
+        row['sku']: row for row in
+        Product.objects.filter(sku__in={row.sku for row in rows})
+        .values('sku', 'product_description', 'product_subcategory_id', 'category_id', 'is_visible')
+    }
+
+    to_create, to_update, hidden = {}, {}, {}
+    created = updated = 0
+    for row in rows:
+        category = categories[row.category.lower()]
+        subcat = subcategories.get((category.pk, row.subcategory.lower())) if row.subcategory else None
+        product = to_create.get(row.sku) or to_update.get(row.sku)
+
+        if product is None and row.sku not in existing:
+            if subcat is None:
+                errors.append((row.line, f"Line {row.line}: create failed (subcategory required)"))
+                continue
+            product = to_create[row.sku] = Product(sku=row.sku, product_description='—')
+            created += 1
+        elif update_existing:
+            if product is None:
+                # columns the row leaves blank keep their current value
+                product = to_update[row.sku] = Product(**existing[row.sku])
+            updated += 1
+        else:
+            errors.append((row.line, f"Line {row.line}: SKU '{row.sku}' exists (skipped)"))
+            continue
+        _assign(product, row, subcat, now)
+        if row.hidden is not None:
+            hidden[row.sku] = row.hidden
+            product.is_visible = not row.hidden
+
+    Product.objects.bulk_create(to_create.values(), batch_size=batch_size)
+    # one INSERT ... ON CONFLICT DO UPDATE per batch; bulk_update's CASE
+    # per row and column is far slower to build and to run
+    Product.objects.bulk_create(to_update.values(), batch_size=batch_size, update_conflicts=True,
+                                unique_fields=['sku'], update_fields=UPDATE_FIELDS)
+
+    # HiddenProduct rows mirror is_visible (see adminpanel.signals)
+    was_hidden = {sku for sku, row in existing.items() if not row['is_visible']}
+    HiddenProduct.objects.bulk_create(
+        [HiddenProduct(product_id=sku) for sku, hide in hidden.items() if hide and sku not in was_hidden],
+        batch_size=batch_size)
+    HiddenProduct.objects.filter(
+        product_id__in=[sku for sku, hide in hidden.items() if not hide and sku in was_hidden]).delete()
+
+    skus = [*to_create, *to_update]
+    if skus or new_categories or new_subcategories:
+        # also bumps the catalog version, which covers the category tree
+        transaction.on_commit(lambda: caching.bump_product_version(*skus))
+    return created, updated
+
+
+def import_rows(rows, update_existing, first_line=2, batch_size=BATCH_SIZE):
+    """Create (and, with ``update_existing``, update) products from CSV rows.
+
+    ``rows`` are csv.DictReader dicts, the first of them numbered
+    ``first_line`` in messages. Returns ``(created, updated, errors)`` with
+    the errors as ``"Line N: ..."`` messages in line order. The rows are
+    applied in one transaction.
+    """
+    errors = []
+    parsed = [row for line_no, raw in enumerate(rows, start=first_line)
+              if (row := parse_row(line_no, raw, errors)) is not None]
+    with transaction.atomic():
+        created, updated = _apply(parsed, update_existing, errors, batch_size)
+    errors.sort(key=lambda error: error[0])
+    return created, updated, [message for _, message in errors]
+
+
+def read_header(f):
+    """Column names on the first line of ``f`` and that line's size in bytes.
+
+    Raises UnicodeDecodeError when the line isn't UTF-8.
+    """
+    first = f.readline()
+    return next(csv.reader([first.decode('utf-8-sig')]), []), len(first)
+
+
+class _Lines:
+    """The decoded lines of binary file ``f`` from byte ``offset`` on.
+
+    ``offset`` follows the lines handed out; csv.reader only takes the
+    lines of the record it returns, so after each record it is where the
+    next one starts (a UTF-8 character never contains a newline byte).
+    """
+    def __init__(self, f, offset):
+        f.seek(offset)
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+
+def import_file(job, chunk_size=CHUNK_ROWS, time_limit=SLICE_SECONDS):
+    """Import the file of ``job`` (an ImportJob) from where it left off.
+
+    Each chunk of rows is committed together with the job's progress.
+    Returns True once the file is done, False if ``time_limit`` seconds ran
+    out first. Raises UnicodeDecodeError or csv.Error for a malformed file.
+    """
+    deadline = time.monotonic() + time_limit
+    with job.file.open('rb') as f:
+        lines = _Lines(f, job.offset)
+        reader = csv.DictReader(lines, fieldnames=job.header)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return True
+            with transaction.atomic():
+                created, updated, errors = import_rows(chunk, job.update_existing,
+                                                       first_line=job.rows_processed + 2)
+                job.offset = lines.offset
+                job.rows_processed += len(chunk)
+                job.created_count += created
+                job.updated_count += updated
+                job.error_count += len(errors)
+                job.errors = (job.errors + errors)[:MAX_STORED_ERRORS]
+                job.save(update_fields=['offset', 'rows_processed', 'created_count', 'updated_count',
+                                        'error_count', 'errors'])
+            if time.monotonic() >= deadline:
+                return False
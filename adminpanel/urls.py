@@ -20,6 +20,7 @@ urlpatterns = [
     path('catalogue/<str:pk>/toggle/', views.product_toggle_active, name='product_toggle'),
     path('catalogue/<str:pk>/toggle_hidden/', views.product_toggle_hidden, name='product_toggle_hidden'),
     path('catalogue/bulk-upload/', views.bulk_products_upload, name='bulk_products_upload'),
+    path('catalogue/bulk-upload/<int:pk>/', views.bulk_upload_progress, name='bulk_upload_progress'),
     path('catalogue/export/', views.catalogue_export, name='catalogue_export'),
     path('catalogue/category/new/', views.category_create, name='category_create'),
     path('catalogue/subcategory/new/', views.subcategory_create, name='subcategory_create'),
@@ -30,4 +31,8 @@ urlpatterns = [
 
     path('customers/', views.customer_list, name='customer_list'),
     path('customers/<int:pk>/', views.customer_detail, name='customer_detail'),
+
+    path('exports/', views.export_list, name='export_list'),
+    path('exports/<str:kind>/start/', views.export_start, name='export_start'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
 ]
\ No newline at end of file
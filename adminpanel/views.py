@@ -1,36 +1,34 @@
 from asyncio.log import logger
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
-from onlineshopfront.models import Product, Category, SubCategory, Customer, Order, OrderItem
-from django.db.models import Q, F, Sum, FloatField, Exists, OuterRef
+from onlineshopfront.models import Product, Category, SubCategory, Customer, Order
+from onlineshopfront import caching
+from django.db.models import Q, Sum
 from .forms import ProductForm, CategoryForm, StaffUserCreationForm, StockUpdateForm, SubCategoryForm, StaffUserRoleForm
 from django.contrib.auth.models import User, Group
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
-from .models import HiddenProduct
+from .models import ExportJob, HiddenProduct, ImportJob
+from .roles import has_role
+from . import dashboard
+from . import exports
+from . import filters
+from . import uploads
 from datetime import datetime, timedelta
 from django.contrib.auth.decorators import login_required, user_passes_test
-import csv, io
-from decimal import Decimal
 from django.db import transaction
 from django.contrib.auth import logout
-from django.http import HttpResponse
-from decimal import Decimal
-from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from jobs.queue import enqueue
 
 def logout_simple(request):
     logout(request)
     return redirect('adminpanel:login')
 
 def groups_required(*names):
-    def check(u):
-        if not u.is_authenticated:
-            return False
-        if u.is_superuser or u.groups.filter(name='Admin').exists():
-            return True
-        return u.groups.filter(name__in=names).exists()
-    return user_passes_test(check)
+    return user_passes_test(lambda u: has_role(u, *names))
 
 @user_passes_test(lambda u: u.is_superuser)
 def staff_list(request):
@@ -96,52 +94,17 @@ def adminpanel(request):
     except ValueError:
         end_date = today
 
-    product_qs = Product.objects.all()
-    if category_id:
-        product_qs = product_qs.filter(product_subcategory__category_id=category_id)
-
-    # KPIs
-    total_skus = product_qs.count()
-    low_stock_count = product_qs.filter(quantity_on_hand__lte=F('reorder_quantity')).count()
-    totals = product_qs.aggregate(
-        total_units=Sum('quantity_on_hand'),
-        inventory_value=Sum(F('quantity_on_hand') * F('unit_price'), output_field=FloatField()),
-    )
-    total_units = totals.get('total_units') or 0
-    inventory_value = totals.get('inventory_value') or 0.0
-
-    sales_items = OrderItem.objects.filter(order__order_date__gte=start_date, order__order_date__lte=end_date)
-    if category_id:
-        sales_items = sales_items.filter(product__product_subcategory__category_id=category_id)
-    sales = sales_items.aggregate(
-        revenue=Sum(F('quantity') * F('unit_price'), output_field=FloatField()),
-        units=Sum('quantity'),
-    )
-    sales_revenue = sales.get('revenue') or 0.0
-    units_sold = sales.get('units') or 0
-    orders_count = sales_items.values('order_id').distinct().count()
-
-    # Top sellers (by units)
-    top_products = list(
-        sales_items.values('product__sku', 'product__product_name')
-        .annotate(total_qty=Sum('quantity'))
-        .order_by('-total_qty')[:5]
-    )
+    # product and sales KPIs, cached per category and range (see dashboard.py)
+    kpis = dashboard.kpis(category_id, start_date, end_date)
 
-    categories = Category.objects.all().order_by('category_name')
+    categories = sorted(caching.cached_categories(), key=lambda c: c.category_name)
     return render(request, 'adminpanel/index.html', {
         'categories': categories,
         'category_id': str(category_id) if category_id else '',
         'start_date': start_date.strftime("%Y-%m-%d"),
         'end_date': end_date.strftime("%Y-%m-%d"),
-        'total_skus': total_skus,
-        'low_stock_count': low_stock_count,
-        'total_units': total_units,
-        'inventory_value': inventory_value,
-        'sales_revenue': sales_revenue,
-        'units_sold': units_sold,
-        'orders_count': orders_count,
-        'top_products': top_products,
+        'can_export_orders': has_role(request.user, *exports.EXPORTS['orders'].roles),
+        **kpis,
     })
 
 @login_required
@@ -153,35 +116,7 @@ def catalogue_list(request):
     visibility_filter = request.GET.getlist('visibility')  # values: 'visible','hidden'
     sort = request.GET.get('sort','').strip()
 
-    qs = Product.objects.all()
-
-    if q:
-        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
-
-    if category_ids:
-        qs = qs.filter(product_subcategory__category__category_id__in=category_ids)
-
-    if subcategory_ids:
-        qs = qs.filter(product_subcategory__subcategory_id__in=subcategory_ids)
-
-    # visibility logic
-    vis = set(visibility_filter)
-    if vis and vis != {'visible','hidden'}:
-        if vis == {'hidden'}:
-            qs = qs.filter(hidden_flag=True)
-        elif vis == {'visible'}:
-            qs = qs.filter(hidden_flag=False)
-
-    if sort == 'sku_asc':
-        qs = qs.order_by('sku')
-    elif sort == 'sku_desc':
-        qs = qs.order_by('-sku')
-    elif sort == 'name_asc':
-        qs = qs.order_by('product_name')
-    elif sort == 'name_desc':
-        qs = qs.order_by('-product_name')
-    else:
-        qs = qs.order_by('sku')
+    qs = filters.catalogue_products(request.GET)
 
     categories = Category.objects.order_by('category_name').prefetch_related('category_subcategory')
     subcategories = SubCategory.objects.order_by('subcategory_name')
@@ -210,149 +145,39 @@ def bulk_products_upload(request):
             f = form.cleaned_data['file']
             update_existing = form.cleaned_data['update_existing']
             try:
-                data = f.read().decode('utf-8-sig')
+                fieldnames, header_size = uploads.read_header(f)
             except UnicodeDecodeError:
                 messages.error(request, "File must be UTF-8 encoded.")
                 return redirect('adminpanel:bulk_products_upload')
 
-            reader = csv.DictReader(io.StringIO(data))
-            if not reader.fieldnames:
+            if not fieldnames:
                 messages.error(request, "Missing header row.")
                 return redirect('adminpanel:bulk_products_upload')
 
-            header_lower = {h.lower(): h for h in reader.fieldnames}
-            required_cols = {'sku','name','category','qty','price'}
-            missing = required_cols - set(header_lower.keys())
+            missing = uploads.missing_columns(fieldnames)
             if missing:
                 messages.error(request, f"Missing required columns: {', '.join(sorted(missing))}")
                 return redirect('adminpanel:bulk_products_upload')
 
-            created = updated = 0
-            errors = []
-
-            # detect fields present on Product
-            product_field_names = {f.name for f in Product._meta.fields}
-            has_hidden_flag = 'hidden_flag' in product_field_names
-
+            # the rows are imported by a job worker (tasks.run_import)
+            f.seek(0)
             with transaction.atomic():
-                for line_no, row in enumerate(reader, start=2):
-                    row_l = {k.lower(): (v or '').strip() for k, v in row.items()}
-
-                    sku         = row_l.get('sku')
-                    name        = row_l.get('name')
-                    cat_name    = row_l.get('category')              
-                    sub_name    = row_l.get('subcategory','')        
-                    desc        = row_l.get('description','')        
-                    qty_raw     = row_l.get('qty')
-                    price_raw   = row_l.get('price')
-                    reorder_raw = row_l.get('reorder_qty') or row_l.get('reorder_quantity') or ''
-                    rating_raw  = row_l.get('rating','')
-                    hidden_raw  = row_l.get('hidden','').lower()
-
-                    if not sku or not name:
-                        errors.append(f"Line {line_no}: missing sku or name")
-                        continue
-                    if not cat_name:
-                        errors.append(f"Line {line_no}: category required")
-                        continue
-
-                    try:
-                        qty = int(qty_raw)
-                    except:
-                        errors.append(f"Line {line_no}: bad qty '{qty_raw}'")
-                        continue
-
-                    try:
-                        price = Decimal(price_raw)
-                    except:
-                        errors.append(f"Line {line_no}: bad price '{price_raw}'")
-                        continue
-
-                    try:
-                        reorder_qty = int(reorder_raw) if reorder_raw else 0
-                    except:
-                        errors.append(f"Line {line_no}: bad reorder_qty '{reorder_raw}' (using 0)")
-                        reorder_qty = 0
-
-                    try:
-                        rating = float(rating_raw) if rating_raw else 0.0
-                    except:
-                        errors.append(f"Line {line_no}: bad rating '{rating_raw}' (using 0.0)")
-                        rating = 0.0
-
-                    category = Category.objects.filter(category_name__iexact=cat_name).first()
-                    if not category:
-                        category = Category.objects.create(category_name=cat_name)
-
-                    subcat = None
-                    if sub_name:
-                        subcat = SubCategory.objects.filter(
-                            category=category,
-                            subcategory_name__iexact=sub_name
-                        ).first()
-                        if not subcat:
-                            subcat = SubCategory.objects.create(category=category, subcategory_name=sub_name)
-
-                    hidden_flag = hidden_raw in {'1','true','yes','y'}
-
-                    prod = Product.objects.filter(sku=sku).first()
-                    if prod:
-                        if update_existing:
-                            prod.product_name = name
-                            prod.product_category = cat_name
-                            if subcat:
-                                prod.product_subcategory = subcat
-                            if desc:
-                                prod.product_description = desc
-                            prod.quantity_on_hand = qty
-                            if 'reorder_quantity' in product_field_names:
-                                prod.reorder_quantity = reorder_qty
-                            if 'unit_price' in product_field_names:
-                                prod.unit_price = float(price)
-                            if 'product_rating' in product_field_names:
-                                prod.product_rating = rating
-                            if has_hidden_flag:
-                                prod.hidden_flag = hidden_flag
-                            prod.save()
-                            updated += 1
-                        else:
-                            errors.append(f"Line {line_no}: SKU '{sku}' exists (skipped)")
-                    else:
-                        create_kwargs = dict(
-                            sku=sku,
-                            product_name=name,
-                            product_description=desc or '—',
-                            product_category=cat_name,
-                            quantity_on_hand=qty,
-                        )
-                        if 'reorder_quantity' in product_field_names:
-                            create_kwargs['reorder_quantity'] = reorder_qty
-                        if 'unit_price' in product_field_names:
-                            create_kwargs['unit_price'] = float(price)
-                        if 'product_rating' in product_field_names:
-                            create_kwargs['product_rating'] = rating
-                        if subcat:
-                            create_kwargs['product_subcategory'] = subcat
-                        if has_hidden_flag:
-                            create_kwargs['hidden_flag'] = hidden_flag
-                        try:
-                            Product.objects.create(**create_kwargs)
-                            created += 1
-                        except Exception as e:
-                            errors.append(f"Line {line_no}: create failed ({e})")
-
-            if created:
-                messages.success(request, f"Created {created} products.")
-            if updated:
-                messages.success(request, f"Updated {updated} products.")
-            if errors:
-                preview = " | ".join(errors[:8]) + (" ..." if len(errors) > 8 else "")
-                messages.error(request, f"{len(errors)} issues: {preview}")
-            return redirect('adminpanel:catalogue_list')
+                job = ImportJob.objects.create(file=f, name=f.name, update_existing=update_existing, size=f.size,
+                                               header=fieldnames, offset=header_size, requested_by=request.user)
+                enqueue('adminpanel.run_import', import_id=job.pk)
+            return redirect('adminpanel:bulk_upload_progress', pk=job.pk)
     else:
         form = BulkProductUploadForm()
     return render(request, 'adminpanel/bulk_products_upload.html', {'form': form})
 
+@login_required
+@groups_required('Manager','Merchandiser')
+def bulk_upload_progress(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    if job.requested_by_id != request.user.pk and not request.user.is_superuser:
+        raise PermissionDenied
+    return render(request, 'adminpanel/bulk_upload_progress.html', {'job': job})
+
 @login_required
 @groups_required('Manager', 'Merchandiser')
 def product_create(request):
@@ -402,12 +227,12 @@ def product_toggle_active(request, pk):
 @groups_required('Manager', 'Merchandiser')
 def product_toggle_hidden(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    hidden = getattr(product, 'hidden_flag', None)
-    if hidden:
-        hidden.delete()
+    # is_visible mirrors HiddenProduct; the signal handlers flip it back
+    if not product.is_visible:
+        HiddenProduct.objects.filter(product=product).delete()
         messages.success(request, f"{product.sku} unhidden.")
     else:
-        HiddenProduct.objects.create(product=product)
+        HiddenProduct.objects.get_or_create(product=product)
         messages.success(request, f"{product.sku} hidden.")
     return redirect('adminpanel:catalogue_list')
 
@@ -440,71 +265,8 @@ def subcategory_create(request):
 @login_required
 @groups_required('Manager', 'Merchandiser')
 def catalogue_export(request):
-    q = request.GET.get('q','').strip()
-    category_ids = request.GET.getlist('categories')
-    subcategory_ids = request.GET.getlist('subcategories')
-    visibility_filter = request.GET.getlist('visibility')
-    sort = request.GET.get('sort','').strip()
-
-    qs = (Product.objects
-          .all()
-          .select_related('product_subcategory', 'product_subcategory__category'))
-
-    if q:
-        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
-    if category_ids:
-        qs = qs.filter(product_subcategory__category__category_id__in=category_ids)
-    if subcategory_ids:
-        qs = qs.filter(product_subcategory__subcategory_id__in=subcategory_ids)
-
-    product_field_names = {f.name for f in Product._meta.fields}
-    has_hidden_flag = 'hidden_flag' in product_field_names
-    if not has_hidden_flag:
-        qs = qs.annotate(hidden_exists=Exists(HiddenProduct.objects.filter(product__pk=OuterRef('pk'))))
-
-    vis = set(visibility_filter)
-    if vis and vis != {'visible','hidden'}:
-        if 'hidden' in vis:
-            qs = qs.filter(hidden_flag=True) if has_hidden_flag else qs.filter(hidden_exists=True)
-        elif 'visible' in vis:
-            qs = qs.filter(hidden_flag=False) if has_hidden_flag else qs.filter(hidden_exists=False)
-
-    if sort == 'sku_asc':
-        qs = qs.order_by('sku')
-    elif sort == 'sku_desc':
-        qs = qs.order_by('-sku')
-    elif sort == 'name_asc':
-        qs = qs.order_by('product_name')
-    elif sort == 'name_desc':
-        qs = qs.order_by('-product_name')
-    else:
-        qs = qs.order_by('sku')
-
-    headers = ['SKU','Name','Category','Subcategory','Qty','Reorder Qty','Unit Price','Rating','Hidden']
-    rows = []
-    for p in qs:
-        cat = p.product_subcategory.category.category_name if p.product_subcategory and p.product_subcategory.category_id else ''
-        sub = p.product_subcategory.subcategory_name if p.product_subcategory else ''
-        hidden = (getattr(p, 'hidden_flag', None) if has_hidden_flag else getattr(p, 'hidden_exists', False)) or False
-        rows.append([
-            p.sku,
-            p.product_name,
-            cat,
-            sub,
-            getattr(p, 'quantity_on_hand', ''),
-            getattr(p, 'reorder_quantity', ''),
-            getattr(p, 'unit_price', ''),
-            getattr(p, 'product_rating', ''),
-            'Yes' if hidden else 'No',
-        ])
-
-    stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-    resp = HttpResponse(content_type='text/csv; charset=utf-8')
-    resp['Content-Disposition'] = f'attachment; filename="products_{stamp}.csv"'
-    writer = csv.writer(resp)
-    writer.writerow(headers)
-    writer.writerows(rows)
-    return resp
+    products = filters.catalogue_products(request.GET)
+    return exports.csv_response('products', exports.CATALOGUE_HEADER, exports.catalogue_rows(products))
 
 @login_required
 @groups_required('Manager', 'Inventory')
@@ -513,24 +275,7 @@ def inventory_list(request):
     show_low = request.GET.get('low') == '1'
     sort = (request.GET.get('sort') or '').strip()
 
-    qs = Product.objects.all()
-
-    if q:
-        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
-
-    if show_low:
-        qs = qs.filter(quantity_on_hand__lte=F('reorder_quantity'))
-
-    if sort == 'sku_asc':
-        qs = qs.order_by('sku')
-    elif sort == 'sku_desc':
-        qs = qs.order_by('-sku')
-    elif sort == 'name_asc':
-        qs = qs.order_by('product_name')
-    elif sort == 'name_desc':
-        qs = qs.order_by('-product_name')
-    else:
-        qs = qs.order_by('sku')
+    qs = filters.inventory_products(request.GET)
 
     paginator = Paginator(qs, 50)
     page_obj = paginator.get_page(request.GET.get('page'))
@@ -561,30 +306,8 @@ def inventory_update_stock(request, pk):
 
 @login_required
 def inventory_export(request):
-    q = (request.GET.get('q') or '').strip()
-    show_low = request.GET.get('low') == '1'
-
-    qs = Product.objects.all().only('sku','product_name','quantity_on_hand','reorder_quantity') \
-         .order_by('sku')
-
-    if q:
-        qs = qs.filter(Q(sku__icontains=q) | Q(product_name__icontains=q))
-    if show_low:
-        qs = qs.filter(quantity_on_hand__lte=F('reorder_quantity'))
-
-    headers = ['SKU', 'Name', 'Qty On Hand', 'Reorder Qty', 'Status']
-    rows = []
-    for p in qs:
-        status = 'LOW' if p.quantity_on_hand <= p.reorder_quantity else 'OK'
-        rows.append([p.sku, p.product_name, p.quantity_on_hand, p.reorder_quantity, status])
-
-    stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-    resp = HttpResponse(content_type='text/csv; charset=utf-8')
-    resp['Content-Disposition'] = f'attachment; filename="inventory_{stamp}.csv"'
-    writer = csv.writer(resp)
-    writer.writerow(headers)
-    writer.writerows(rows)
-    return resp
+    products = filters.inventory_products(request.GET)
+    return exports.csv_response('inventory', exports.INVENTORY_HEADER, exports.inventory_rows(products))
 
 
 @login_required
@@ -603,22 +326,6 @@ def customer_list(request):
     sel_income = request.GET.getlist('income')
     sel_prefcat = request.GET.getlist('preferred_category')
 
-    age_ranges = [
-        ('15-20', 15, 20),
-        ('20-30', 20, 30),
-        ('30-40', 30, 40),
-        ('40-50', 40, 50),
-        ('50-60', 50, 60),
-        ('60+', 60, None),
-    ]
-    income_ranges = [
-        ('0-2000', 0, 2000),
-        ('2000-5000', 2000, 5000),
-        ('5000-10000', 5000, 10000),
-        ('10000-20000', 10000, 20000),
-        ('20000+', 20000, None),
-    ]
-
     def distinct_values(field):
         return list(
             Customer.objects
@@ -642,71 +349,7 @@ def customer_list(request):
     )
     prefcat_opts = distinct_values('preferred_category')
 
-    total = Customer.objects.count()
-    qs = Customer.objects.all().order_by('id')
-    if total >= 101:
-        qs = qs.filter(id__gte=101)
-
-    if q:
-        qs = qs.filter(
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(email__icontains=q) |
-            Q(phone__icontains=q) |
-            Q(occupation__icontains=q) |
-            Q(education__icontains=q) |
-            Q(preferred_category__icontains=q)
-        )
-
-    if sel_gender:
-        qs = qs.filter(gender__in=sel_gender)
-    if sel_employment:
-        qs = qs.filter(employment_status__in=sel_employment)
-    if sel_occupation:
-        qs = qs.filter(occupation__in=sel_occupation)
-    if sel_education:
-        qs = qs.filter(education__in=sel_education)
-    if sel_household:
-        ints = []
-        for v in sel_household:
-            try:
-                ints.append(int(v))
-            except ValueError:
-                pass
-        if ints:
-            qs = qs.filter(household_size__in=ints)
-    if sel_children:
-        vals = []
-        for v in sel_children:
-            if v in ('0', '1'):
-                vals.append(int(v))
-        if vals:
-            qs = qs.filter(has_children__in=vals)
-    if sel_prefcat:
-        qs = qs.filter(preferred_category__in=sel_prefcat)
-
-    if sel_age:
-        age_q = Q()
-        for label, lo, hi in age_ranges:
-            if label in sel_age:
-                if hi is None:
-                    age_q |= Q(age__gte=lo)
-                else:
-                    # inclusive lower, exclusive upper to avoid overlap
-                    age_q |= Q(age__gte=lo, age__lt=hi)
-        if age_q:
-            qs = qs.filter(age_q)
-
-    if sel_income:
-        inc_q = Q()
-        for label, lo, hi in income_ranges:
-            if label in sel_income:
-                if hi is None:
-                    inc_q |= Q(monthly_income__gte=lo)
-                else:
-                    inc_q |= Q(monthly_income__gte=lo, monthly_income__lt=hi)
-        if inc_q:
-            qs = qs.filter(inc_q)
+    qs = filters.customers(request.GET)
 
     paginator = Paginator(qs, 50)
     customers_page = paginator.get_page(page)
@@ -719,8 +362,8 @@ def customer_list(request):
         'customers': customers_page,
         'q': q,
         # options
-        'age_ranges': age_ranges,
-        'income_ranges': income_ranges,
+        'age_ranges': filters.AGE_RANGES,
+        'income_ranges': filters.INCOME_RANGES,
         'gender_opts': gender_opts,
         'employment_opts': employment_opts,
         'occupation_opts': occupation_opts,
@@ -763,3 +406,51 @@ def customer_detail(request, pk):
         'total_spent': total_spent,
     })
 
+
+@login_required
+def export_start(request, kind):
+    """Queue a background export of ``kind`` with the list page's filters."""
+    export_kind = exports.EXPORTS.get(kind)
+    if export_kind is None:
+        raise Http404("Unknown export.")
+    if not has_role(request.user, *export_kind.roles):
+        raise PermissionDenied
+    if request.method != 'POST':
+        return redirect('adminpanel:export_list')
+
+    params = {key: values for key, values in request.GET.lists() if key != 'page'}
+    with transaction.atomic():
+        export = ExportJob.objects.create(kind=kind, params=params, compress=request.POST.get('gzip') == '1',
+                                          requested_by=request.user)
+        # a failed export is reported on the exports page rather than retried
+        enqueue('adminpanel.run_export', max_attempts=1, export_id=export.pk)
+    messages.success(request, f"{export_kind.label} export queued; it will be listed here when ready.")
+    return redirect('adminpanel:export_list')
+
+@login_required
+def export_list(request):
+    jobs = ExportJob.objects.all() if request.user.is_superuser else ExportJob.objects.filter(requested_by=request.user)
+    jobs = list(jobs[:50])
+    for job in jobs:
+        kind = exports.EXPORTS.get(job.kind)
+        job.label = kind.label if kind else job.kind
+        job.expires_at = job.finished_at + exports.retention() if job.finished_at else None
+    return render(request, 'adminpanel/export_list.html', {
+        'jobs': jobs,
+        'any_pending': any(job.pending for job in jobs),
+    })
+
+@login_required
+def export_download(request, pk):
+    export = get_object_or_404(ExportJob, pk=pk, status=ExportJob.DONE)
+    if export.requested_by_id != request.user.pk and not request.user.is_superuser:
+        raise PermissionDenied
+    # the requester may have lost the role since asking for the export
+    kind = exports.EXPORTS.get(export.kind)
+    if kind is None or not has_role(request.user, *kind.roles):
+        raise PermissionDenied
+    if not export.file or exports.expired(export):
+        raise Http404("Export file missing or expired.")
+    content_type = 'application/gzip' if export.compress else 'text/csv; charset=utf-8'
+    return FileResponse(export.file.open('rb'), as_attachment=True, filename=export.file_name,
+                        content_type=content_type)
@@ -10,22 +10,47 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name, default=()):
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+# AURORAMART_ENV=production switches on the production profile below
+# (persistent connections, SQLite WAL tuning, cached sessions, DEBUG off);
+# it needs a shared cache backend unless DJANGO_SINGLE_PROCESS is set.
+# Individual settings can still be overridden through DJANGO_* variables.
+PRODUCTION = os.environ.get('AURORAMART_ENV', 'development') == 'production'
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-k2xa26%xkz=@pow5bja*8b0wvkju@cecrl8zo6n8-kx@-g!($e'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-k2xa26%xkz=@pow5bja*8b0wvkju@cecrl8zo6n8-kx@-g!($e')
+if PRODUCTION and SECRET_KEY.startswith('django-insecure-'):
+    raise ImproperlyConfigured("Set DJANGO_SECRET_KEY when AURORAMART_ENV=production")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', not PRODUCTION)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
 
 
 # Application definition
@@ -39,11 +64,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'adminpanel',
     'onlineshopfront',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'onlineshopfront.cart_storage.GuestCartMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -57,8 +84,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # parsed templates are kept in memory (this is also Django's
+            # implicit default; spelled out so it isn't lost if loaders change)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -74,7 +108,17 @@ LOGIN_URL = 'adminpanel:login'
 LOGIN_REDIRECT_URL = 'adminpanel:adminpanel'
 LOGOUT_REDIRECT_URL = 'adminpanel:login'
 
+# Guest (not logged-in) carts; see onlineshopfront/cart_storage.py
+GUEST_CART_STORAGE = 'onlineshopfront.cart_storage.SignedCookieCartStorage'
+
+# Route the storefront index, product list and product detail pages to the
+# async views in onlineshopfront/views_async.py. Only worth it when served
+# through ASGI_APPLICATION (e.g. uvicorn auroramartproj.asgi:application);
+# under WSGI every async view runs in a fresh event loop per request.
+ASYNC_STOREFRONT = env_bool('DJANGO_ASYNC_STOREFRONT', False)
+
 WSGI_APPLICATION = 'auroramartproj.wsgi.application'
+ASGI_APPLICATION = 'auroramartproj.asgi.application'
 
 
 # Database
@@ -83,10 +127,67 @@ WSGI_APPLICATION = 'auroramartproj.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DJANGO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        # keep connections open between requests (seconds; 0 closes per request)
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600 if PRODUCTION else 0)),
+        'CONN_HEALTH_CHECKS': PRODUCTION,
+        'OPTIONS': {
+            # take the write lock when a transaction starts so concurrent
+            # checkouts queue instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+if env_bool('DJANGO_SQLITE_WAL', PRODUCTION):
+    # run on every new connection: WAL lets readers proceed during a write,
+    # synchronous=NORMAL is durable in WAL mode except on power loss, plus a
+    # 64MB page cache, 256MB of memory-mapped I/O and a 5s wait on locks
+    DATABASES['default']['OPTIONS']['init_command'] = ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-65536',
+        'PRAGMA mmap_size=268435456',
+        'PRAGMA busy_timeout=5000',
+        'PRAGMA temp_store=MEMORY',
+    ])
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The catalog caches (onlineshopfront/caching.py) invalidate through version
+# keys, so every process must share one cache: LocMem is per process and
+# only suits a single-process server. Point DJANGO_CACHE_BACKEND at e.g.
+# django.core.cache.backends.redis.RedisCache for multi-process deployments.
+
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'auroramart'),
+        'TIMEOUT': 300,
+        # room for the per-page and per-card entries of a large catalog
+        'OPTIONS': {'MAX_ENTRIES': 20000} if CACHE_BACKEND.endswith('LocMemCache') else {},
     }
 }
 
+# LocMem (and Dummy) caches are private to one process
+SHARED_CACHE = not CACHE_BACKEND.endswith(('LocMemCache', 'DummyCache'))
+if PRODUCTION and not SHARED_CACHE and not env_bool('DJANGO_SINGLE_PROCESS', False):
+    raise ImproperlyConfigured(
+        "Set DJANGO_CACHE_BACKEND (and DJANGO_CACHE_LOCATION) to a shared cache such as Redis or memcached "
+        "when AURORAMART_ENV=production, or DJANGO_SINGLE_PROCESS=1 if the site runs in one process")
+
+# Sessions are read from the cache and written through to the database.
+# With a per-process cache another worker would keep serving its stale copy
+# of a session after a login, logout or cart change, so they stay in the
+# database alone.
+if PRODUCTION and SHARED_CACHE:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+SESSION_COOKIE_SECURE = env_bool('DJANGO_SECURE_COOKIES', PRODUCTION)
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,6 +230,11 @@ STATICFILES_DIRS = [
     BASE_DIR / "onlineshopfront" / "static",
 ]
 
+# Uploaded and generated files (e.g. the admin panel's background exports,
+# which are only served through an access-checked view)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = Path(os.environ.get('DJANGO_MEDIA_ROOT', BASE_DIR / 'media'))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker(worker_id, stop, poll_interval, once):
+    # imported here: a spawned process loads this module before django.setup()
+    from jobs import queue
+    try:
+        return queue.work(worker_id, stop=stop, poll_interval=poll_interval, once=once)
+    finally:
+        connections.close_all()
+
+
+def _process_main(worker_id, stop, poll_interval, once):
+    import django
+    django.setup()
+    # Ctrl-C reaches the whole process group; the parent sets ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker(worker_id, stop, poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (threads or processes) until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", dest="workers", type=int, default=2)
+        parser.add_argument("--mode", dest="mode", choices=("thread", "process"), default="thread")
+        parser.add_argument("--poll-interval", dest="poll_interval", type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        n, mode = options["workers"], options["mode"]
+        base = f"{socket.gethostname()}:{os.getpid()}"
+        args = (options["poll_interval"], options["once"])
+
+        if mode == "process":
+            # workers open their own connections; don't share ours across fork
+            connections.close_all()
+            stop = multiprocessing.Event()
+            workers = [multiprocessing.Process(target=_process_main, args=(f"{base}:p{i}", stop, *args))
+                       for i in range(n)]
+        else:
+            stop = threading.Event()
+            workers = [threading.Thread(target=_worker, args=(f"{base}:t{i}", stop, *args), daemon=True)
+                       for i in range(n)]
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        self.stdout.write(f"Starting {n} {mode} workers")
+        for w in workers:
+            w.start()
+        try:
+            for w in workers:
+                while w.is_alive():
+                    w.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for w in workers:
+                w.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
@@ -0,0 +1,161 @@
+"""A small job queue on top of the ``Job`` table.
+
+Register functions with ``@register('name')`` in an app's ``tasks.py`` and
+call ``enqueue('name', **payload)``; the payload must be JSON serialisable.
+Enqueueing inside a transaction (e.g. order placement) means the job only
+becomes visible to workers once that transaction commits.
+
+Failed jobs are retried with exponential backoff until ``max_attempts``;
+a job registered with ``on_failure`` has it called once it fails for good.
+The worker renews a running job's lease (``JOB_LEASE_SECONDS``) while it
+runs. A job left running by a worker that died is picked up again once the
+lease runs out, or failed if that was its last attempt, so job functions
+should be safe to run twice.
+"""
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_failure_handlers = {}
+
+BACKOFF_BASE = 10
+BACKOFF_MAX = 60 * 60
+DEFAULT_LEASE = 10 * 60
+
+
+def register(name, on_failure=None):
+    """Decorator registering ``func`` as the handler for jobs called ``name``.
+
+    ``on_failure(error, **payload)`` runs after the last attempt has failed,
+    with the traceback as ``error``, so the caller can record the outcome.
+    """
+    def decorator(func):
+        _registry[name] = func
+        if on_failure is not None:
+            _failure_handlers[name] = on_failure
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, max_attempts=5, **payload):
+    if name not in _registry:
+        raise KeyError(f"No job registered as {name!r}")
+    return Job.objects.create(name=name, payload=payload, max_attempts=max_attempts,
+                              run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts`` (10s, 20s, 40s, ... 1h)."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', DEFAULT_LEASE))
+
+
+def _give_up(job, error):
+    """Record that ``job`` has failed for good and run its failure handler."""
+    logger.error("Job %s failed permanently:\n%s", job, error)
+    on_failure = _failure_handlers.get(job.name)
+    if on_failure is not None:
+        try:
+            on_failure(error, **job.payload)
+        except Exception:
+            logger.exception("Failure handler of job %s failed", job)
+
+
+def _fail_abandoned(now):
+    """Fail jobs whose worker died during their last attempt."""
+    abandoned = Q(status=Job.RUNNING, locked_at__lt=now - _lease(), attempts__gte=F('max_attempts'))
+    for job in Job.objects.filter(abandoned):
+        error = f"Lease expired while running on {job.locked_by}."
+        if Job.objects.filter(abandoned, pk=job.pk).update(status=Job.FAILED, last_error=error, finished_at=now,
+                                                            locked_by=''):
+            _give_up(job, error)
+
+
+def claim(worker_id):
+    """Claim the next due job for ``worker_id``; None when there is none.
+
+    Picks a candidate, then takes it with an UPDATE that only matches while
+    it is still claimable; losing the race to another worker just means
+    trying the next one.
+    """
+    _fail_abandoned(timezone.now())
+    while True:
+        now = timezone.now()
+        claimable = Q(status=Job.QUEUED, run_after__lte=now) | Q(
+            status=Job.RUNNING, locked_at__lt=now - _lease(), attempts__lt=F('max_attempts'))
+        pk = Job.objects.filter(claimable).order_by('run_after', 'pk').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        taken = Job.objects.filter(claimable, pk=pk).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+        if taken:
+            return Job.objects.get(pk=pk)
+
+
+def _renew_lease(job, stop):
+    """Keep ``job``'s lease from running out until ``stop`` is set."""
+    try:
+        while not stop.wait(_lease().total_seconds() / 3):
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+                locked_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    stop = threading.Event()
+    threading.Thread(target=_renew_lease, args=(job, stop), daemon=True).start()
+    try:
+        func = _registry[job.name]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error, finished_at=now, locked_by='')
+            _give_up(job, error)
+        else:
+            logger.warning("Job %s failed, retrying:\n%s", job, error)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, last_error=error, locked_by='',
+                run_after=now + timedelta(seconds=backoff(job.attempts)))
+        return False
+    finally:
+        stop.set()
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), locked_by='')
+    return True
+
+
+def work(worker_id, stop=None, poll_interval=1.0, once=False):
+    """Worker loop: claim and run jobs until ``stop`` is set.
+
+    With ``once`` it returns as soon as the queue has nothing due.
+    Returns the number of jobs run.
+    """
+    done = 0
+    while stop is None or not stop.is_set():
+        job = claim(worker_id)
+        if job is None:
+            if once:
+                break
+            if stop is not None:
+                stop.wait(poll_interval)
+            continue
+        run(job)
+        done += 1
+    return done
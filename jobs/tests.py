@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .models import Job
+from . import queue
+
+calls = []
+failures = []
+
+
+@queue.register('jobs.test.flaky', on_failure=lambda error, fail_times: failures.append(error))
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('boom')
+
+
+@queue.register('jobs.test.slow')
+def slow(seconds):
+    time.sleep(seconds)
+    # whether another worker could take this job over by now
+    calls.append(queue.claim('w2'))
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        failures.clear()
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = queue.enqueue('jobs.test.flaky', fail_times=1)
+        self.assertEqual(queue.work('w1', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+
+        # not due yet; then due after the backoff
+        self.assertIsNone(queue.claim('w1'))
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(queue.work('w1', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+    def test_claim_is_exclusive_until_lease_expires(self):
+        job = queue.enqueue('jobs.test.flaky', fail_times=0)
+        self.assertEqual(queue.claim('w1').pk, job.pk)
+        self.assertIsNone(queue.claim('w2'))
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.claim('w2').locked_by, 'w2')
+
+    def test_abandoned_last_attempt_is_failed_not_rerun(self):
+        job = queue.enqueue('jobs.test.flaky', fail_times=0, max_attempts=1)
+        self.assertEqual(queue.claim('w1').pk, job.pk)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(queue.claim('w2'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.FAILED, 'Lease expired while running on w1.'))
+        self.assertEqual(failures, ['Lease expired while running on w1.'])
+        self.assertEqual(calls, [])
+
+    def test_gives_up_after_max_attempts(self):
+        job = queue.enqueue('jobs.test.flaky', fail_times=5, max_attempts=2)
+        queue.work('w1', once=True)
+        self.assertEqual(failures, [])
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        queue.work('w1', once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(len(failures), 1)
+        self.assertIn('RuntimeError: boom', failures[0])
+
+
+class LeaseRenewalTests(TransactionTestCase):
+    """A TransactionTestCase, since the lease is renewed from another thread."""
+    def setUp(self):
+        calls.clear()
+
+    def test_lease_is_renewed_while_the_job_runs(self):
+        job = queue.enqueue('jobs.test.slow', seconds=0.6)
+        with self.settings(JOB_LEASE_SECONDS=0.3):
+            self.assertEqual(queue.work('w1', once=True), 1)
+        self.assertEqual(calls, [None])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
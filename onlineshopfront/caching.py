@@ -0,0 +1,280 @@
+"""Cache helpers for the storefront.
+
+Rendered product cards are cached as template fragments keyed by SKU and a
+per-product version number. The versions live in the cache themselves and
+are bumped by the signal handlers in ``signals.py`` whenever a product (or
+its hidden flag) changes, so stale fragments are simply never read again.
+
+Whole storefront pages are also cached for anonymous visitors, keyed by the
+catalog version (see ``anonymous_page_cache``), and catalog pages answer
+their conditional GETs from the same version (see ``catalog_etag``).
+Both decorators also wrap async views; their session, cache and database
+work then runs in a thread rather than in the event loop.
+"""
+import hashlib
+import re
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from time import time_ns
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import Category, Product
+
+CATALOG_VERSION_KEY = 'catalog:version'
+PRODUCT_VERSION_KEY = 'catalog:product:{sku}:version'
+PAGE_CACHE_KEY = 'page:{version}:{digest}'
+CATEGORIES_KEY = 'catalog:{version}:categories'
+
+# version counters must outlive the fragments they key
+VERSION_TIMEOUT = None
+# how long a rendered card fragment may sit in the cache
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# cached anonymous pages; catalog changes already switch to a new key
+PAGE_CACHE_TIMEOUT = 60 * 5
+CATEGORY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _new_version():
+    # nanosecond timestamps are unique enough across processes and sort in
+    # the order the changes happened
+    return time_ns()
+
+
+def catalog_version():
+    """Return the current catalog-wide version, initialising it if needed."""
+    return cache.get_or_set(CATALOG_VERSION_KEY, _new_version, VERSION_TIMEOUT)
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, _new_version(), VERSION_TIMEOUT)
+
+
+def cached_categories():
+    """All categories (header nav, filter dropdowns), cached per catalog version."""
+    key = CATEGORIES_KEY.format(version=catalog_version())
+    return cache.get_or_set(key, lambda: list(Category.objects.all()), CATEGORY_CACHE_TIMEOUT)
+
+
+def bump_product_version(*skus):
+    """Invalidate the cached cards of the given SKUs (and the catalog version)."""
+    version = _new_version()
+    values = {PRODUCT_VERSION_KEY.format(sku=sku): version for sku in skus}
+    values[CATALOG_VERSION_KEY] = version
+    cache.set_many(values, VERSION_TIMEOUT)
+
+
+def attach_card_versions(products):
+    """Set ``card_version`` on each product using a single cache round trip.
+
+    Templates pass ``p.card_version`` to ``{% cache %}`` so a fragment is
+    re-rendered only after the product has changed. Returns the products as
+    a list so callers can keep iterating without re-querying.
+    """
+    products = list(products)
+    if not products:
+        return products
+    keys = {PRODUCT_VERSION_KEY.format(sku=p.pk): p for p in products}
+    found = cache.get_many(keys.keys())
+    missing = {}
+    for key, product in keys.items():
+        if key not in found:
+            found[key] = missing[key] = _new_version()
+        product.card_version = found[key]
+    if missing:
+        cache.set_many(missing, VERSION_TIMEOUT)
+    return products
+
+
+# Per-visitor slots in a cached page. They are blanked before the page is
+# stored and filled in again for every visitor that is served from cache.
+CART_COUNT_SLOT = re.compile(r'<!--cart-count-->.*?<!--/cart-count-->', re.S)
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+CSRF_PLACEHOLDER = 'name="csrfmiddlewaretoken" value="__csrf_token__"'
+
+
+def page_cache_key(request):
+    """Path + normalized query string (sorted, blanks dropped) + catalog version."""
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+        if value != ''
+    )
+    raw = f"{request.path}?{urlencode(params)}"
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return PAGE_CACHE_KEY.format(version=catalog_version(), digest=digest)
+
+
+def _has_pending_notice(request):
+    # one-shot notices are rendered into the page by the view itself
+    return 'in_card_notif' in request.session or len(messages.get_messages(request)) > 0
+
+
+def _page_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return not _has_pending_notice(request)
+
+
+def _cart_count_html(cart_count):
+    return render_to_string('onlineshopfront/_cart_count.html', {'cart_count': cart_count}).strip()
+
+
+def _strip_visitor_slots(html):
+    html = CART_COUNT_SLOT.sub(_cart_count_html(0), html)
+    return CSRF_INPUT.sub(CSRF_PLACEHOLDER, html)
+
+
+def _fill_visitor_slots(request, html):
+    from .context_processors import guest_cart_count
+    cart_html = _cart_count_html(guest_cart_count(request))
+    html = CART_COUNT_SLOT.sub(lambda m: cart_html, html, count=1)
+    if CSRF_PLACEHOLDER in html:
+        html = html.replace(CSRF_PLACEHOLDER, f'name="csrfmiddlewaretoken" value="{get_token(request)}"')
+    return html
+
+
+def anonymous_page_cache(view):
+    """Serve anonymous GETs of a storefront page from the cache.
+
+    The cached copy is stored without the visitor's cart count and csrf
+    token; both are filled back in per request, so a cache hit never runs
+    the view. Logged-in users, and visitors with a pending notification,
+    always get a freshly rendered page.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not _page_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            html, content_type = cached
+            return HttpResponse(_fill_visitor_slots(request, html), content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            html = response.content.decode(response.charset)
+            cache.set(key, (_strip_visitor_slots(html), response['Content-Type']), PAGE_CACHE_TIMEOUT)
+        return response
+
+    @wraps(view)
+    async def async_wrapped(request, *args, **kwargs):
+        key = await sync_to_async(_page_cache_key_if_cacheable)(request)
+        if key is None:
+            return await view(request, *args, **kwargs)
+
+        cached = await cache.aget(key)
+        if cached is not None:
+            html, content_type = cached
+            html = await sync_to_async(_fill_visitor_slots)(request, html)
+            return HttpResponse(html, content_type=content_type)
+
+        response = await view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            html = response.content.decode(response.charset)
+            await cache.aset(key, (_strip_visitor_slots(html), response['Content-Type']), PAGE_CACHE_TIMEOUT)
+        return response
+
+    return async_wrapped if iscoroutinefunction(view) else wrapped
+
+
+def _page_cache_key_if_cacheable(request):
+    return page_cache_key(request) if _page_cacheable(request) else None
+
+
+def _conditional(request):
+    # signed-in visitors get personalised recommendations, which the
+    # catalog version doesn't cover; one-shot notices are rendered into the
+    # page by the view
+    return not request.user.is_authenticated and not _has_pending_notice(request)
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag for a catalog page, computed before the view runs.
+
+    Only anonymous visitors get one (see ``_conditional``). Besides the
+    catalog version it covers everything per-visitor the page renders:
+    their cart count and the csrf cookie the page's forms are signed
+    against.
+    """
+    from .context_processors import guest_cart_count
+    if not _conditional(request):
+        return None
+    parts = [
+        request.get_full_path(),
+        catalog_version(),
+        guest_cart_count(request),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def catalog_last_modified(request, pk=None, **kwargs):
+    """Latest of the catalog version time and, on a detail page, the product's updated_at."""
+    if not _conditional(request):
+        return None
+    modified = datetime.fromtimestamp(catalog_version() / 1e9, tz=dt_timezone.utc)
+    if pk is not None:
+        updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at and updated_at > modified:
+            modified = updated_at
+    return modified
+
+
+def catalog_conditional(view):
+    """Answer If-None-Match / If-Modified-Since with a 304 before the view runs.
+
+    Pages carry a per-visitor cart badge and csrf token, so they are marked
+    private and browsers must revalidate them on every use. Signed-in
+    visitors always get the page rendered again.
+    """
+    if iscoroutinefunction(view):
+        view = _async_catalog_condition(view)
+    else:
+        view = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)(view)
+    return cache_control(private=True, no_cache=True)(view)
+
+
+class _PreconditionsMet(HttpResponse):
+    pass
+
+
+def _async_catalog_condition(view):
+    """``condition()`` for an async view, without blocking the event loop.
+
+    The ETag and Last-Modified functions read the session and the database,
+    so the precondition check runs in a thread against a stub view. When it
+    lets the request through, the real view is awaited and gets the
+    validators the check computed.
+    """
+    @sync_to_async
+    @condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+    def check(request, *args, **kwargs):
+        return _PreconditionsMet()
+
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        checked = await check(request, *args, **kwargs)
+        if not isinstance(checked, _PreconditionsMet):
+            # 304 Not Modified / 412 Precondition Failed
+            return checked
+        response = await view(request, *args, **kwargs)
+        for header in ('ETag', 'Last-Modified'):
+            if checked.has_header(header) and not response.has_header(header):
+                response[header] = checked[header]
+        return response
+    return wrapped
@@ -0,0 +1,136 @@
+"""Where a guest's cart ({sku: qty}) is kept between requests.
+
+The backend is chosen by the ``GUEST_CART_STORAGE`` setting:
+
+* ``SignedCookieCartStorage`` (default) keeps the cart in a compact signed
+  cookie, so browsing and editing a guest cart never writes the session
+  table;
+* ``SessionCartStorage`` keeps it in ``request.session['cart']`` as before.
+
+Views read and replace the whole cart through ``guest_cart(request)``;
+``GuestCartMiddleware`` writes the cookie back only when the cart changed.
+Logged-in carts live in the Cart/CartItem tables and don't use this.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+DEFAULT_STORAGE = 'onlineshopfront.cart_storage.SignedCookieCartStorage'
+
+
+def _clean(lines):
+    """Drop anything that isn't a sku -> positive quantity pair."""
+    if not isinstance(lines, dict):
+        return {}
+    cleaned = {}
+    for sku, qty in lines.items():
+        try:
+            qty = int(qty)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(sku, str) and qty > 0:
+            cleaned[sku] = qty
+    return cleaned
+
+
+class BaseCartStorage:
+    def __init__(self, request):
+        self.request = request
+        self._lines = None
+        self.changed = False
+
+    @property
+    def lines(self):
+        """The cart as {sku: qty}; treat as read-only and use set() to change it."""
+        if self._lines is None:
+            self._lines = self._load()
+        return self._lines
+
+    def count(self):
+        return sum(self.lines.values())
+
+    def fits(self, lines):
+        """Whether ``lines`` can be stored by this backend."""
+        return True
+
+    def set(self, lines):
+        lines = _clean(lines)
+        if lines != self.lines:
+            self._lines = lines
+            self.changed = True
+            self._save(lines)
+
+    def clear(self):
+        self.set({})
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _save(self, lines):
+        pass
+
+    def update_response(self, response):
+        pass
+
+
+class SessionCartStorage(BaseCartStorage):
+    def _load(self):
+        return _clean(self.request.session.get('cart'))
+
+    def _save(self, lines):
+        if lines:
+            self.request.session['cart'] = lines
+        else:
+            self.request.session.pop('cart', None)
+
+
+class SignedCookieCartStorage(BaseCartStorage):
+    cookie_name = 'cart'
+    salt = 'onlineshopfront.cart_storage'
+    max_age = 30 * 24 * 60 * 60
+    # stay under the ~4KB per-cookie limit browsers enforce
+    max_bytes = 3800
+
+    def _load(self):
+        value = self.request.COOKIES.get(self.cookie_name)
+        if not value:
+            return {}
+        try:
+            return _clean(signing.loads(value, salt=self.salt, max_age=self.max_age))
+        except signing.BadSignature:
+            return {}
+
+    def _encode(self, lines):
+        return signing.dumps(lines, salt=self.salt, compress=True)
+
+    def fits(self, lines):
+        return len(self._encode(_clean(lines))) <= self.max_bytes
+
+    def update_response(self, response):
+        if not self.changed:
+            return
+        if self.lines:
+            response.set_cookie(
+                self.cookie_name, self._encode(self.lines), max_age=self.max_age, httponly=True,
+                samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+        else:
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+
+
+def guest_cart(request):
+    """The request's guest cart storage (one instance per request)."""
+    storage = getattr(request, '_guest_cart', None)
+    if storage is None:
+        storage_class = import_string(getattr(settings, 'GUEST_CART_STORAGE', DEFAULT_STORAGE))
+        storage = request._guest_cart = storage_class(request)
+    return storage
+
+
+class GuestCartMiddleware(MiddlewareMixin):
+    """Persist the guest cart on the response (after SessionMiddleware)."""
+    def process_response(self, request, response):
+        storage = getattr(request, '_guest_cart', None)
+        if storage is not None:
+            storage.update_response(response)
+        return response
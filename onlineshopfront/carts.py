@@ -0,0 +1,189 @@
+"""Cart loading shared by the cart and checkout views.
+
+A cart is returned as ``(items, total)`` where each item is the dict the
+templates render (sku, name, price, quantity, subtotal, product). DB carts
+are read with one ``select_related`` query and guest (session) carts with
+one ``in_bulk`` query, however many lines they have. Lines for hidden
+products (see HiddenProduct) are left out; they come back if the product
+is shown again.
+
+The header badge count of a customer's cart is cached per user, so all of
+their sessions share it; every change to a DB cart goes through this
+module (or ``orders.place_order``) and drops it with ``forget_cart_count``.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .cart_storage import guest_cart
+from .models import Cart, CartItem, Product, StockReservation
+from . import recommender
+
+CART_COUNT_KEY = 'cart:count:{user_id}'
+# bounds how long a change made elsewhere (e.g. the Django admin) goes unseen
+CART_COUNT_TIMEOUT = 5 * 60
+
+
+def _line(product, quantity):
+    subtotal = quantity * product.unit_price
+    return {'sku': product.sku, 'name': product.product_name, 'price': product.unit_price,
+            'quantity': quantity, 'subtotal': subtotal, 'product': product}
+
+
+def _summarise(lines):
+    items = [_line(p, q) for p, q in lines]
+    return items, sum((item['subtotal'] for item in items), 0.0)
+
+
+def db_cart_items(cart_items):
+    """Build the cart from a CartItem queryset (e.g. ``cart.items.all()``)."""
+    rows = cart_items.filter(product__is_visible=True).select_related('product').order_by('pk')
+    return _summarise((ci.product, ci.quantity) for ci in rows)
+
+
+def customer_cart_items(user):
+    """Cart of a logged-in user, without loading Customer/Cart separately."""
+    return db_cart_items(CartItem.objects.filter(cart__cart_customer__user=user))
+
+
+def customer_cart_count(user):
+    """Sum of quantities in the logged-in user's DB cart, cached per user."""
+    key = CART_COUNT_KEY.format(user_id=user.pk)
+    count = cache.get(key)
+    if count is None:
+        items = CartItem.objects.filter(cart__cart_customer__user=user, product__is_visible=True)
+        count = items.aggregate(total=Sum('quantity'))['total'] or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def forget_cart_count(user_id):
+    """Drop the cached cart count of ``user_id`` once the change commits."""
+    key = CART_COUNT_KEY.format(user_id=user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def guest_cart_items(lines):
+    """Cart of a guest from its {sku: qty} lines (see cart_storage).
+
+    SKUs that no longer exist or are hidden are skipped.
+    """
+    if not lines:
+        return [], 0.0
+    products = Product.objects.visible().in_bulk(list(lines))
+    return _summarise((products[sku], int(qty)) for sku, qty in lines.items() if sku in products)
+
+
+def cart_items(request):
+    if request.user.is_authenticated:
+        return customer_cart_items(request.user)
+    return guest_cart_items(guest_cart(request).lines)
+
+
+def merge_guest_cart(customer, lines):
+    """Add a guest's {sku: qty} cart into the customer's DB cart.
+
+    Runs a fixed number of queries whatever the cart size: one product
+    lookup, one read of the matching cart items, then one bulk_create and
+    one bulk_update, all in a single transaction. Unknown and hidden SKUs
+    are skipped.
+    """
+    wanted = {sku: int(qty) for sku, qty in lines.items() if int(qty) > 0}
+    if not wanted:
+        return
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(cart_customer=customer)
+        known = set(Product.objects.visible().filter(pk__in=wanted).values_list('pk', flat=True))
+        existing = {ci.product_id: ci for ci in CartItem.objects.filter(cart=cart, product_id__in=known)}
+        for sku, ci in existing.items():
+            ci.quantity += wanted[sku]
+        CartItem.objects.bulk_update(existing.values(), ['quantity'])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=sku, quantity=wanted[sku])
+            for sku in known if sku not in existing
+        ])
+        forget_cart_count(customer.user_id)
+
+
+def _stock_error(product, qty, held=0):
+    # units other carts hold aren't available; this cart's own hold is
+    available = product.quantity_available + held
+    if qty > available:
+        return f"Only {available} of {product.product_name} available; quantity not changed."
+    return None
+
+
+def update_customer_quantities(user, updates):
+    """Apply {sku: qty} from the cart form to the user's DB cart.
+
+    Zero or negative quantities remove the line. Uses at most three
+    statements in one transaction: a bulk delete, one fetch of the lines
+    being changed (with their product and hold for the stock check) and one
+    bulk_update. Lines asking for more than is available to the cart (see
+    reservations.py) are left unchanged; returns the list of messages for
+    them.
+    """
+    errors = []
+    zeroed = [sku for sku, qty in updates.items() if qty <= 0]
+    changed = {sku: qty for sku, qty in updates.items() if qty > 0}
+    items = CartItem.objects.filter(cart__cart_customer__user=user)
+    with transaction.atomic():
+        if zeroed:
+            items.filter(product_id__in=zeroed).delete()
+        if changed:
+            to_update = []
+            holds = StockReservation.objects.filter(cart_id=OuterRef('cart_id'), product_id=OuterRef('product_id'))
+            lines = (items.filter(product_id__in=changed).select_related('product')
+                     .annotate(held=Coalesce(Subquery(holds.values('quantity')[:1]), 0)))
+            for ci in lines:
+                qty = changed[ci.product_id]
+                error = _stock_error(ci.product, qty, ci.held)
+                if error:
+                    errors.append(error)
+                elif qty != ci.quantity:
+                    ci.quantity = qty
+                    to_update.append(ci)
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        forget_cart_count(user.pk)
+    return errors
+
+
+def update_guest_quantities(lines, updates):
+    """Same as update_customer_quantities for a guest's {sku: qty} cart.
+
+    Modifies ``lines`` in place with one product query for the stock check.
+    """
+    errors = []
+    changed = {}
+    for sku, qty in updates.items():
+        if qty <= 0:
+            lines.pop(sku, None)
+        else:
+            changed[sku] = qty
+    products = Product.objects.in_bulk(list(changed)) if changed else {}
+    for sku, qty in changed.items():
+        product = products.get(sku)
+        if product is None:
+            continue
+        error = _stock_error(product, qty)
+        if error:
+            errors.append(error)
+        else:
+            lines[sku] = qty
+    return errors
+
+
+def recommended_products(items, limit=4):
+    """Visible products bought together with the cart's SKUs (not already in it)."""
+    cart_skus = [item['sku'] for item in items]
+    if not cart_skus:
+        return []
+    try:
+        recommended_skus = recommender.get_associated_products(cart_skus)
+    except Exception as e:
+        print(f"Recommendation failed for cart: {e}")
+        return []
+    if not recommended_skus:
+        return []
+    return list(Product.objects.visible().filter(sku__in=recommended_skus).exclude(sku__in=cart_skus)[:limit])
@@ -0,0 +1,178 @@
+"""Storefront product filtering, sorting and recommendation blocks.
+
+The filters are shared by the HTML product list (``views.product_list``)
+and the JSON catalog API (``views_api``) so both accept the same query
+parameters. The recommendation helpers at the bottom are the independent
+lookups of the index, list and detail pages, shared by the sync views and
+their async counterparts in ``views_async``.
+"""
+from collections import defaultdict
+
+from django.db.models import F, Q
+from django.http import Http404
+
+from .models import Cart, CartItem, Customer, Product
+from . import caching
+from . import recommender
+
+# friendly ?sort= names -> ORM orderings
+SORT_ORDERINGS = {
+    'price_asc': 'unit_price',
+    'price_desc': '-unit_price',
+    'rating_desc': '-product_rating',
+    'rating_asc': 'product_rating',
+    'name_asc': 'product_name',
+    'name_desc': '-product_name',
+    'available': '-quantity_on_hand',
+}
+DEFAULT_ORDERING = 'product_name'
+
+
+def category_by_slug(categories, slug):
+    """Resolve a slug against the cached category list instead of querying."""
+    for c in categories:
+        if c.slug == slug:
+            return c
+    raise Http404("No Category matches the given query.")
+
+
+def ordering_for(sort):
+    return SORT_ORDERINGS.get(sort or '', DEFAULT_ORDERING)
+
+
+def filter_products(params, categories, category_slug=None):
+    """Apply the storefront filters in ``params`` (usually ``request.GET``).
+
+    Returns ``(products, category)``: the unordered queryset of visible
+    products and the Category being browsed, if any. A category in the URL
+    must exist (404); one from the filter form is ignored when unknown, and
+    so are malformed numeric filters.
+    """
+    category = None
+    products = Product.objects.visible()
+    q = params.get('q')
+    if q:
+        products = products.filter(Q(product_name__icontains=q) | Q(sku__icontains=q))
+
+    if category_slug:
+        category = category_by_slug(categories, category_slug)
+    elif params.get('category'):
+        try:
+            category = category_by_slug(categories, params.get('category'))
+        except Http404:
+            pass
+    if category is not None:
+        # indexed FK (kept in sync with product_subcategory) rather than the
+        # free-text `product_category` column
+        products = products.filter(category=category)
+
+    # Filters: price range, rating, availability
+    for param, lookup in (('min_price', 'unit_price__gte'),
+                          ('max_price', 'unit_price__lte'),
+                          ('min_rating', 'product_rating__gte')):
+        value = params.get(param)
+        if value:
+            try:
+                products = products.filter(**{lookup: float(value)})
+            except ValueError:
+                pass
+
+    available = params.get('available')
+    if available and available.lower() in ('1', 'true', 'yes', 'on'):
+        # available to promise: stock not held by other shoppers' carts
+        products = products.filter(quantity_on_hand__gt=F('quantity_reserved'))
+
+    return products, category
+
+
+# --- recommendation blocks shared by the sync and async storefront views ---
+
+def recommended_for(sku, limit=4):
+    """Visible products frequently bought together with ``sku``."""
+    try:
+        recommended_skus = recommender.get_associated_products([sku])
+        if recommended_skus:
+            return list(Product.objects.visible().filter(sku__in=recommended_skus).exclude(pk=sku)[:limit])
+    except Exception as e:
+        print(f"Error getting product recommendations: {e}")
+    return []
+
+
+def similar_to(sku, limit=5):
+    """Top-rated visible products from the same subcategory as ``sku``.
+
+    The subcategory is looked up in a subquery so this doesn't have to wait
+    for the product itself to be loaded.
+    """
+    try:
+        subcategory = Product.objects.filter(pk=sku).values('product_subcategory')
+        return list(Product.objects.visible().filter(product_subcategory__in=subcategory)
+                    .exclude(pk=sku).order_by('-product_rating')[:limit])
+    except Exception:
+        return []
+
+
+def next_best_products(user, products, limit=4):
+    """"Next best action": recommendations for the user's cart that are
+    neither in the cart nor in the listing being browsed."""
+    try:
+        cart = Cart.objects.filter(cart_customer__user=user).first()
+        skus_in_cart = list(CartItem.objects.filter(cart=cart).values_list('product_id', flat=True)) if cart else []
+        if skus_in_cart:
+            recommended_skus = recommender.get_associated_products(skus_in_cart)
+            return list(Product.objects.visible().filter(sku__in=recommended_skus)
+                        .exclude(sku__in=skus_in_cart)
+                        .exclude(sku__in=products.values('sku'))[:limit])
+    except Exception as e:
+        print(f"Error getting next best action: {e}")
+    return []
+
+
+def attach_similar_products(page_products, limit=4):
+    """Set ``similar_products`` on each product of a listing page (one query)."""
+    try:
+        subcat_ids = {p.product_subcategory_id for p in page_products}
+        subcat_ids.discard(None)
+        page_skus = [p.sku for p in page_products]
+        similar_qs = (Product.objects.visible().filter(product_subcategory_id__in=subcat_ids)
+                      .exclude(sku__in=page_skus).order_by('-product_rating'))
+        sim_map = defaultdict(list)
+        for s in similar_qs:
+            sim_map[s.product_subcategory_id].append(s)
+        for p in page_products:
+            p.similar_products = sim_map.get(p.product_subcategory_id, [])[:limit]
+    except Exception:
+        # on any error, ensure attribute exists to avoid template errors
+        for p in page_products:
+            p.similar_products = []
+    return page_products
+
+
+def predicted_recommendations(user, categories, limit=24):
+    """Top products of the category the classifier predicts for the user.
+
+    Returns ``(predicted_category, products)``; either may be None.
+    """
+    cust = Customer.objects.filter(user=user).first()
+    if cust is None:
+        return None, None
+    profile = {
+        'age': cust.age or 0,
+        'household_size': cust.household_size or 0,
+        'has_children': cust.has_children or 0,
+        'monthly_income_sgd': cust.monthly_income or 0.0,
+        'gender': cust.gender or 'Male',
+        'employment_status': cust.employment_status or 'Full-time',
+        'occupation': cust.occupation or 'Other',
+        'education': cust.education or 'Secondary',
+    }
+    try:
+        predicted_category = recommender.predict_preferred_category(profile)
+        predicted = next((c for c in categories if predicted_category and c.category_name.lower() == predicted_category.lower()), None)
+        recommended_products = None
+        if predicted is not None:
+            recommended_products = caching.attach_card_versions(
+                Product.objects.visible().filter(category=predicted).order_by('-product_rating')[:limit])
+        return predicted_category, recommended_products
+    except Exception:
+        return None, None
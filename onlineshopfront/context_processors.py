@@ -1,32 +1,28 @@
-from .models import Category
-from .models import Cart, CartItem
+from . import caching
+from . import carts
+from .cart_storage import guest_cart
+
+
+def guest_cart_count(request):
+    """Sum of quantities in a guest's cart (see cart_storage)."""
+    return guest_cart(request).count()
 
 
 def site_categories(request):
     """Provide categories for the header/navigation on every template."""
     try:
-        cats = Category.objects.all()
+        cats = caching.cached_categories()
     except Exception:
         cats = []
-    # compute a simple cart_count: if user has a linked Customer and Cart, sum quantities
+    # a logged-in user's count is cached by the cart service (see carts)
     cart_count = 0
     try:
         if request.user and request.user.is_authenticated:
-            # try to get customer's cart
-            try:
-                cust = request.user.customer_profile
-                cart = Cart.objects.filter(cart_customer=cust).first()
-                if cart:
-                    cart_count = sum(ci.quantity for ci in cart.items.all())
-            except Exception:
-                cart_count = 0
+            cart_count = carts.customer_cart_count(request.user)
         else:
-            # for anonymous users, use session cart stored as {sku: qty}
-            sess = getattr(request, 'session', None)
-            if sess:
-                s = sess.get('cart', {})
-                cart_count = sum(int(v) for v in s.values()) if isinstance(s, dict) else 0
+            cart_count = guest_cart_count(request)
     except Exception:
         cart_count = 0
 
-    return {"site_categories": cats, "cart_count": cart_count}
+    # for the {% cache %} tags around product cards
+    return {"site_categories": cats, "cart_count": cart_count, "card_cache_timeout": caching.CARD_CACHE_TIMEOUT}
@@ -0,0 +1,88 @@
+"""Streaming product feed (NDJSON or CSV) for marketplace/search syncing.
+
+Rows are read with ``.values_list().iterator(chunk_size=...)`` and encoded
+one at a time, so memory stays flat however large the catalog is. Used by
+``views_api.product_feed`` and the ``export_product_feed`` command.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Product
+
+# feed column -> ORM path
+FEED_COLUMNS = [
+    ('sku', 'sku'),
+    ('name', 'product_name'),
+    ('price', 'unit_price'),
+    ('stock', 'quantity_on_hand'),
+    ('category', 'category__category_name'),
+    ('rating', 'product_rating'),
+    ('active', 'is_visible'),
+    ('updated_at', 'updated_at'),
+]
+FEED_FORMATS = ('ndjson', 'csv')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def parse_changed_since(value):
+    """Parse an ISO date or datetime; naive values are taken as server time.
+
+    Raises ValueError for anything else.
+    """
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            raise ValueError(f"Invalid date/time: {value!r}")
+        dt = datetime.combine(d, time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def feed_rows(changed_since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one dict per product, in SKU order.
+
+    The full feed only contains products visible on the storefront. A delta
+    (``changed_since``) also includes products hidden since then, with
+    ``active`` false, so partners can delist them.
+    """
+    qs = Product.objects.order_by('sku')
+    if changed_since is not None:
+        qs = qs.filter(updated_at__gte=changed_since)
+    else:
+        qs = qs.visible()
+    names = [name for name, _ in FEED_COLUMNS]
+    for row in qs.values_list(*[path for _, path in FEED_COLUMNS]).iterator(chunk_size=chunk_size):
+        yield dict(zip(names, row))
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in FEED_COLUMNS])
+    for row in rows:
+        yield writer.writerow([
+            v.isoformat() if isinstance(v, datetime) else v
+            for v in row.values()
+        ])
+
+
+def feed_lines(fmt, changed_since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = feed_rows(changed_since=changed_since, chunk_size=chunk_size)
+    return csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from onlineshopfront import feeds
+
+
+class Command(BaseCommand):
+    help = "Write the product feed (NDJSON or CSV) to a file or stdout, streaming rows in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="format", choices=feeds.FEED_FORMATS, default="ndjson")
+        parser.add_argument("--output", dest="output", help="Output file (default: stdout)")
+        parser.add_argument("--changed-since", dest="changed_since", help="Only products modified since this ISO date/time")
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=feeds.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        changed_since = None
+        if options.get("changed_since"):
+            try:
+                changed_since = feeds.parse_changed_since(options["changed_since"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        lines = feeds.feed_lines(options["format"], changed_since=changed_since, chunk_size=options["chunk_size"])
+        path = options.get("output")
+        out = open(path, "w", encoding="utf-8", newline="") if path else sys.stdout
+        count = 0
+        try:
+            for line in lines:
+                out.write(line)
+                count += 1
+        finally:
+            if path:
+                out.close()
+
+        if path:
+            rows = count - 1 if options["format"] == "csv" else count
+            self.stderr.write(self.style.SUCCESS(f"Wrote {rows} products to {path}"))
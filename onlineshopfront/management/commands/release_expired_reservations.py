@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from onlineshopfront import reservations
+
+
+class Command(BaseCommand):
+    help = "Release expired stock reservations (run every minute or so from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000)
+        parser.add_argument("--recount", action="store_true",
+                            help="Also rebuild Product.quantity_reserved from the remaining holds")
+
+    def handle(self, *args, **options):
+        released = reservations.release_expired(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
+        if options["recount"]:
+            updated = reservations.recount_reserved()
+            self.stdout.write(self.style.SUCCESS(f"Recounted reserved stock for {updated} products"))
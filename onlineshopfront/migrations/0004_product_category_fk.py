@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_product_category(apps, schema_editor):
+    # one UPDATE ... SET category_id = (SELECT ...) instead of a save() per row
+    Product = apps.get_model('onlineshopfront', 'Product')
+    SubCategory = apps.get_model('onlineshopfront', 'SubCategory')
+    Product.objects.update(category_id=Subquery(
+        SubCategory.objects.filter(pk=OuterRef('product_subcategory_id')).values('category_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineshopfront', '0003_customer_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='products', to='onlineshopfront.category'),
+        ),
+        migrations.RunPython(backfill_product_category, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'product_name'], name='product_cat_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'unit_price'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'product_rating'], name='product_cat_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'quantity_on_hand'], name='product_cat_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['product_rating'], name='product_rating_idx'),
+        ),
+    ]
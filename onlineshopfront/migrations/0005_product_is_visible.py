@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:21
+
+from django.db import migrations, models
+
+
+def backfill_is_visible(apps, schema_editor):
+    Product = apps.get_model('onlineshopfront', 'Product')
+    HiddenProduct = apps.get_model('adminpanel', 'HiddenProduct')
+    Product.objects.filter(pk__in=HiddenProduct.objects.values('product_id')).update(is_visible=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineshopfront', '0004_product_category_fk'),
+        ('adminpanel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_visible',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.RunPython(backfill_is_visible, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineshopfront', '0007_product_quantity_reserved_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlineshopfront', '0008_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
@@ -57,17 +57,57 @@ PRODUCT_CATEGORY = [
     ('Toys & Games', 'Toys & Games'),
 ]
 
+class ProductQuerySet(models.QuerySet):
+    def visible(self):
+        """Products shown on the storefront (not hidden from the admin panel)."""
+        return self.filter(is_visible=True)
+
+
 class Product(models.Model):
     sku = models.CharField(max_length=50, primary_key=True)
     product_name = models.CharField(max_length=255)
     product_description = models.TextField()
     product_category = models.CharField(max_length=50, choices = PRODUCT_CATEGORY)
     quantity_on_hand = models.IntegerField()
+    # units held by live StockReservations; available to promise is
+    # quantity_on_hand - quantity_reserved (see reservations.py)
+    quantity_reserved = models.PositiveIntegerField(default=0)
     reorder_quantity = models.IntegerField()
     unit_price = models.FloatField()
     product_rating = models.FloatField()
 
     product_subcategory = models.ForeignKey('Subcategory', on_delete=models.RESTRICT, related_name='products')
+    # copy of product_subcategory.category kept in sync by save(); storefront
+    # filtering and sorting go through the (category, column) indexes below
+    category = models.ForeignKey('Category', on_delete=models.RESTRICT, null=True, blank=True, related_name='products')
+    # False while an adminpanel.HiddenProduct row exists for this SKU; kept in
+    # sync by adminpanel.signals so storefront queries avoid an EXISTS per row
+    is_visible = models.BooleanField(default=True, db_index=True)
+    # bulk paths that bypass save() (queryset.update/bulk_update) set this explicitly
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'product_name'], name='product_cat_name_idx'),
+            models.Index(fields=['category', 'unit_price'], name='product_cat_price_idx'),
+            models.Index(fields=['category', 'product_rating'], name='product_cat_rating_idx'),
+            models.Index(fields=['category', 'quantity_on_hand'], name='product_cat_stock_idx'),
+            models.Index(fields=['product_rating'], name='product_rating_idx'),
+        ]
+
+    @property
+    def quantity_available(self):
+        return max(self.quantity_on_hand - self.quantity_reserved, 0)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self.product_subcategory_id and (update_fields is None or 'product_subcategory' in update_fields):
+            self.category_id = self.product_subcategory.category_id
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'category'}
+        super().save(*args, **kwargs)
 
 class Category(models.Model):
     category_id = models.AutoField(primary_key=True)
@@ -101,6 +141,16 @@ class CartItem(models.Model):
     def subtotal_price(self):
         return self.quantity * self.product.unit_price
 
+class StockReservation(models.Model):
+    """Time-boxed hold on stock for one cart line (see reservations.py)."""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('cart', 'product')
+
 class Employee(models.Model):
     employee_id = models.AutoField(primary_key=True)
     employee_name = models.CharField(max_length=255)
@@ -117,13 +167,16 @@ class Order(models.Model):
 
     order_id = models.AutoField(primary_key=True)
     order_status = models.CharField(max_length = 50, choices = ORDER_STATUS)
-    order_date = models.DateField()
+    order_date = models.DateField(db_index=True)
     order_price = models.FloatField(default=0.0)
     required_date = models.DateField()
     shipped_date = models.DateField(blank=True, null= True)
     shipping_fee = models.FloatField(default=0.0)
 
     customer = models.ForeignKey(Customer, on_delete=models.RESTRICT, related_name = 'customer_orders')
+    # token from the checkout form; a resubmitted form finds this order
+    # instead of placing another (see orders.place_order)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
     
     def update_order_total(self):
         total = sum(item.subtotal for item in self.order_items.all())
@@ -0,0 +1,113 @@
+"""Order placement for the checkout view.
+
+``place_order`` turns cart lines into an Order in a single transaction:
+items are bulk-created, stock is decremented with one conditional UPDATE
+(so two checkouts can never oversell the same SKU) and the cart lines are
+removed with one DELETE. Units the cart holds (see reservations.py) count
+as available to it and the holds are consumed with the order. Follow-up
+work is queued as a background job (see tasks.py).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from .models import Order, OrderItem, Product, StockReservation
+from . import caching
+from . import carts
+from .reservations import per_sku
+
+
+class InsufficientStock(Exception):
+    """Raised when cart lines ask for more than is on hand.
+
+    ``products`` lists the names of the short products.
+    """
+    def __init__(self, products):
+        self.products = products
+        super().__init__(f"Insufficient stock for: {', '.join(products)}")
+
+
+def _short_products(quantities, held):
+    return list(Product.objects.filter(
+        pk__in=quantities,
+        quantity_on_hand__lt=F('quantity_reserved') - per_sku(held) + per_sku(quantities),
+    ).values_list('product_name', flat=True))
+
+
+def placed_order(customer, idempotency_key):
+    """The customer's order already placed with this checkout token, if any."""
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(customer=customer, idempotency_key=idempotency_key).first()
+
+
+def place_order(customer, cart, selected=None, idempotency_key=None):
+    """Create an Order from ``cart`` (only the ``selected`` SKUs, if given).
+
+    Lines for hidden products are not ordered and stay in the cart.
+    Returns the Order, or None when there is nothing to order. Raises
+    InsufficientStock, leaving cart and stock untouched, if any line cannot
+    be fulfilled. When ``idempotency_key`` was already used by this
+    customer, the original order is returned and nothing is written.
+    """
+    lines = cart.items.filter(product__is_visible=True)
+    if selected:
+        lines = lines.filter(product_id__in=selected)
+    try:
+        return _place_order(customer, cart, lines, idempotency_key)
+    except IntegrityError:
+        # a concurrent submit with the same key committed first
+        order = placed_order(customer, idempotency_key)
+        if order is None:
+            raise
+        return order
+
+
+def _place_order(customer, cart, lines, idempotency_key):
+    with transaction.atomic():
+        order = placed_order(customer, idempotency_key)
+        if order is not None:
+            return order
+        rows = list(lines.values_list('product_id', 'quantity', 'product__unit_price'))
+        if not rows:
+            return None
+        quantities = {sku: qty for sku, qty, _price in rows}
+        holds = StockReservation.objects.filter(cart=cart, product_id__in=quantities)
+        # units this cart already holds count as available to it
+        held = dict(holds.values_list('product_id', 'quantity'))
+
+        # decrement every SKU in one statement; a row only matches while stock
+        # not reserved by other carts covers the line, so a short count means
+        # an oversell
+        wanted, own = per_sku(quantities), per_sku(held)
+        updated = Product.objects.filter(
+            pk__in=quantities, quantity_on_hand__gte=F('quantity_reserved') - own + wanted,
+        ).update(
+            quantity_on_hand=F('quantity_on_hand') - wanted,
+            quantity_reserved=F('quantity_reserved') - own,
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            transaction.set_rollback(True)
+            order = None
+        else:
+            total = lines.aggregate(total=Sum(F('quantity') * F('product__unit_price')))['total'] or 0.0
+            today = timezone.now().date()
+            order = Order.objects.create(order_status='Order Placed', order_date=today, order_price=total,
+                                         required_date=today, shipping_fee=0.0, customer=customer,
+                                         idempotency_key=idempotency_key or None)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=sku, quantity=qty, unit_price=price)
+                for sku, qty, price in rows
+            ])
+            lines.delete()
+            holds.delete()
+            carts.forget_cart_count(customer.user_id)
+            # follow-up work (alerts, ...) runs in a worker once this commits
+            enqueue('onlineshopfront.order_placed', order_id=order.pk)
+            transaction.on_commit(lambda: caching.bump_product_version(*quantities))
+
+    if order is None:
+        raise InsufficientStock(_short_products(quantities, held))
+    return order
@@ -0,0 +1,125 @@
+"""Time-boxed stock reservations for logged-in carts.
+
+Adding to cart holds the units for ``STOCK_RESERVATION_TTL`` seconds by
+bumping ``Product.quantity_reserved`` with a conditional UPDATE, so
+available-to-promise (``quantity_on_hand - quantity_reserved``) is a column
+read and two shoppers can never hold the same last unit. Holds are
+refreshed when the cart changes or checkout starts, consumed by
+``orders.place_order`` and, once expired, released in bulk by the
+``release_expired_reservations`` command. No row lock outlives the
+statement that takes it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+DEFAULT_TTL = 15 * 60
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL))
+
+
+def per_sku(values):
+    """SQL expression giving ``values[sku]`` for each product row (0 otherwise)."""
+    return Case(*[When(pk=sku, then=Value(v)) for sku, v in values.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def reserve(cart, product_id, quantity):
+    """Hold ``quantity`` more units of a product for ``cart``.
+
+    Returns False, holding nothing, when fewer units are available.
+    """
+    with transaction.atomic():
+        held = Product.objects.filter(
+            pk=product_id, quantity_on_hand__gte=F('quantity_reserved') + quantity,
+        ).update(quantity_reserved=F('quantity_reserved') + quantity)
+        if not held:
+            return False
+        expires_at = _expires_at()
+        extended = StockReservation.objects.filter(cart=cart, product_id=product_id).update(
+            quantity=F('quantity') + quantity, expires_at=expires_at)
+        if not extended:
+            StockReservation.objects.create(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+    return True
+
+
+def sync_cart(cart):
+    """Make the cart's holds match its lines and restart their TTL.
+
+    Lines that grew (or whose hold expired) are topped up with whatever is
+    still available. Returns the names of products that could not be held
+    in full.
+    """
+    with transaction.atomic():
+        lines = dict(cart.items.values_list('product_id', 'quantity'))
+        holds = dict(StockReservation.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+        change = {}
+        short = []
+        increases = {sku: qty - holds.get(sku, 0) for sku, qty in lines.items() if qty > holds.get(sku, 0)}
+        if increases:
+            rows = (Product.objects.select_for_update().filter(pk__in=increases)
+                    .values_list('pk', 'product_name', 'quantity_on_hand', 'quantity_reserved'))
+            for sku, name, on_hand, reserved in rows:
+                granted = max(0, min(increases[sku], on_hand - reserved))
+                if granted:
+                    change[sku] = granted
+                if granted < increases[sku]:
+                    short.append(name)
+        for sku, qty in holds.items():
+            if qty > lines.get(sku, 0):
+                change[sku] = lines.get(sku, 0) - qty
+
+        if change:
+            Product.objects.filter(pk__in=change).update(quantity_reserved=F('quantity_reserved') + per_sku(change))
+        wanted = {sku: holds.get(sku, 0) + change.get(sku, 0) for sku in {*holds, *change}}
+        released = [sku for sku, qty in wanted.items() if qty <= 0]
+        if released:
+            StockReservation.objects.filter(cart=cart, product_id__in=released).delete()
+        expires_at = _expires_at()
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart=cart, product_id=sku, quantity=qty, expires_at=expires_at)
+             for sku, qty in wanted.items() if qty > 0],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity', 'expires_at'])
+    return short
+
+
+def release_expired(now=None, batch_size=1000):
+    """Release holds past their expiry; returns how many were released.
+
+    Each batch is one read of the expired holds, one UPDATE of the products'
+    reserved counters and one DELETE.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(StockReservation.objects.select_for_update()
+                        .filter(expires_at__lte=now)
+                        .values_list('pk', 'product_id', 'quantity')[:batch_size])
+            if not rows:
+                return released
+            totals = {}
+            for _pk, sku, qty in rows:
+                totals[sku] = totals.get(sku, 0) + qty
+            Product.objects.filter(pk__in=totals).update(
+                quantity_reserved=F('quantity_reserved') - per_sku(totals))
+            StockReservation.objects.filter(pk__in=[pk for pk, _sku, _qty in rows]).delete()
+        released += len(rows)
+
+
+def recount_reserved():
+    """Rebuild every product's quantity_reserved from the holds that exist.
+
+    Repairs drift, e.g. after carts were deleted together with their holds.
+    """
+    live = (StockReservation.objects.filter(product=OuterRef('pk')).order_by()
+            .values('product').annotate(total=Sum('quantity')).values('total'))
+    return Product.objects.update(quantity_reserved=Coalesce(Subquery(live), 0))
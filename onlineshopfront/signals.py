@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category, SubCategory
+from . import caching
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_card(sender, instance, **kwargs):
+    # wait for the commit so a concurrent request can't re-cache the old row
+    # under the new version (bulk uploads run inside one big transaction)
+    sku = instance.pk
+    transaction.on_commit(lambda: caching.bump_product_version(sku))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_category_tree(sender, **kwargs):
+    transaction.on_commit(caching.bump_catalog_version)
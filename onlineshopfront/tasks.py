@@ -0,0 +1,22 @@
+"""Background jobs for the storefront (run by ``manage.py run_workers``)."""
+import logging
+
+from django.core.mail import mail_admins
+from django.db.models import F
+
+from jobs.queue import register
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+@register('onlineshopfront.order_placed')
+def order_placed(order_id):
+    """Follow-up work after checkout; currently the low-stock alert."""
+    low = list(Product.objects.filter(order_items__order_id=order_id, quantity_on_hand__lte=F('reorder_quantity'))
+               .values_list('sku', 'product_name', 'quantity_on_hand'))
+    if not low:
+        return
+    lines = [f"{sku} {name}: {qty} left" for sku, name, qty in low]
+    logger.warning("Low stock after order %s: %s", order_id, '; '.join(lines))
+    mail_admins(f"Low stock after order {order_id}", '\n'.join(lines), fail_silently=True)
@@ -0,0 +1,34 @@
+"""Catalog and customer fixtures shared by the storefront and admin panel tests."""
+from .models import Category, Customer, Product, SubCategory
+
+
+def make_subcategory(category='Books', subcategory='Fiction'):
+    """Return the subcategory, creating it and its category if missing."""
+    cat, _ = Category.objects.get_or_create(category_name=category, defaults={'slug': category.lower()})
+    return SubCategory.objects.get_or_create(subcategory_name=subcategory, category=cat)[0]
+
+
+def make_product(sku='BK-1', subcategory=None, **fields):
+    """Create a product in ``subcategory`` (Books/Fiction by default).
+
+    Every required field has a default; ``fields`` override them.
+    """
+    sub = subcategory or make_subcategory()
+    values = {
+        'product_name': 'A Book', 'product_description': 'A book',
+        'product_category': sub.category.category_name, 'quantity_on_hand': 5, 'reorder_quantity': 1,
+        'unit_price': 10.0, 'product_rating': 4.0, 'product_subcategory': sub,
+    }
+    values.update(fields)
+    return Product.objects.create(sku=sku, **values)
+
+
+def make_customer(user=None, **fields):
+    """Create a customer profile, for ``user`` if given; ``fields`` override the defaults."""
+    values = {
+        'user': user, 'email': user.email if user else 'buyer@example.com', 'age': 30, 'gender': 'Male',
+        'employment_status': 'Full-time', 'occupation': '', 'education': 'Secondary', 'household_size': 1,
+        'has_children': 0, 'monthly_income': 0.0, 'preferred_category': 'Books',
+    }
+    values.update(fields)
+    return Customer.objects.create(**values)
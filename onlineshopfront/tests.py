@@ -1,5 +1,26 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import Http404
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase
 from django.urls import reverse
+from django.utils import timezone
+
+from adminpanel.models import HiddenProduct
+from . import caching, carts, orders, reservations, views, views_async
+from .caching import CSRF_INPUT, CSRF_PLACEHOLDER
+from .cart_storage import SignedCookieCartStorage
+from .models import Cart, CartItem, Order, Product
+from .testing import make_customer, make_product, make_subcategory
 
 
 class AuthSmokeTests(TestCase):
@@ -29,3 +50,432 @@ class AuthSmokeTests(TestCase):
 		resp2 = self.client.post(login_url, data={'email': email, 'password': pwd}, follow=True)
 		self.assertEqual(resp2.status_code, 200)
 		self.assertTrue(resp2.wsgi_request.user.is_authenticated)
+
+
+class ProductCardCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.product = make_product('BK-1', product_name='Old Title')
+
+	def test_saving_product_refreshes_cached_card(self):
+		url = reverse('onlineshopfront:product_list')
+		self.assertContains(self.client.get(url), 'Old Title')
+
+		self.product.product_name = 'New Title'
+		with self.captureOnCommitCallbacks(execute=True):
+			self.product.save()
+
+		resp = self.client.get(url)
+		self.assertContains(resp, 'New Title')
+		self.assertNotContains(resp, 'Old Title')
+
+
+	def test_card_fragments_use_the_card_cache_timeout(self):
+		url = reverse('onlineshopfront:product_detail', args=['BK-1'])
+		# signed in, so only the fragments are cached; a zero timeout stores
+		# nothing, so an edit that skips the signals still shows
+		self.client.force_login(User.objects.create_user('reader'))
+		with mock.patch.object(caching, 'CARD_CACHE_TIMEOUT', 0):
+			self.assertContains(self.client.get(url), 'Old Title')
+			Product.objects.filter(pk='BK-1').update(product_name='Quiet Edit')
+			self.assertContains(self.client.get(url), 'Quiet Edit')
+
+
+class AnonymousPageCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		make_product('BK-1', product_name='Cached Book')
+
+	def test_repeat_anonymous_view_is_served_without_queries(self):
+		url = reverse('onlineshopfront:product_list') + '?sort=price_asc&q='
+		self.client.get(url)
+		with self.assertNumQueries(0):
+			resp = self.client.get(reverse('onlineshopfront:product_list') + '?sort=price_asc')
+		self.assertContains(resp, 'Cached Book')
+
+	def test_cached_page_shows_each_visitors_cart_count(self):
+		url = reverse('onlineshopfront:product_list')
+		self.client.get(url)
+		self.client.post(reverse('onlineshopfront:add_to_cart', args=['BK-1']), {'quantity': 3})
+		self.client.get(url)  # consumes the in-card notification
+		resp = self.client.get(url)
+		self.assertContains(resp, '<span class="cart-count">3</span>', html=True)
+		self.assertNotIn('__csrf_token__', resp.content.decode())
+
+
+class HiddenProductVisibilityTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.product = make_product('BK-1', product_name='Secret Book')
+
+	def test_hidden_product_disappears_from_storefront(self):
+		hidden = HiddenProduct.objects.create(product=self.product)
+		self.product.refresh_from_db()
+		self.assertFalse(self.product.is_visible)
+		self.assertNotContains(self.client.get(reverse('onlineshopfront:product_list')), 'Secret Book')
+		self.assertEqual(self.client.get(reverse('onlineshopfront:product_detail', args=['BK-1'])).status_code, 404)
+
+		hidden.delete()
+		self.product.refresh_from_db()
+		self.assertTrue(self.product.is_visible)
+
+
+class ConditionalGetTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.product = make_product('BK-1')
+
+	def test_unchanged_product_detail_returns_304(self):
+		url = reverse('onlineshopfront:product_detail', args=['BK-1'])
+		self.client.get(url)  # first visit issues the csrf cookie the ETag covers
+		etag = self.client.get(url)['ETag']
+		resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 304)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.product.save()
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_signed_in_pages_are_not_conditional(self):
+		# the index recommends from the visitor's profile, which the catalog
+		# version doesn't cover
+		self.client.force_login(User.objects.create_user('shopper', 'shopper@example.com', 'pw'))
+		url = reverse('onlineshopfront:index')
+		resp = self.client.get(url)
+		self.assertFalse(resp.has_header('ETag'))
+		self.assertFalse(resp.has_header('Last-Modified'))
+		resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+		self.assertEqual(resp.status_code, 200)
+
+
+class CatalogApiTests(TestCase):
+	def setUp(self):
+		for i, price in enumerate([5.0, 3.0, 5.0, 1.0, 4.0]):
+			make_product(f'BK-{i}', product_name=f'Book {i}', quantity_on_hand=i, unit_price=price)
+
+	def test_cursor_pages_cover_every_product_once(self):
+		url = reverse('onlineshopfront:api_product_list')
+		seen, cursor = [], None
+		while True:
+			params = {'sort': 'price_desc', 'limit': 2, 'fields': 'sku,price'}
+			if cursor:
+				params['cursor'] = cursor
+			data = self.client.get(url, params).json()
+			self.assertTrue(all(set(r) == {'sku', 'price'} for r in data['results']))
+			seen += [r['sku'] for r in data['results']]
+			cursor = data['next']
+			if not cursor:
+				break
+		self.assertEqual(seen, ['BK-0', 'BK-2', 'BK-4', 'BK-1', 'BK-3'])
+
+	def test_unknown_field_is_rejected(self):
+		resp = self.client.get(reverse('onlineshopfront:api_product_list'), {'fields': 'sku,password'})
+		self.assertEqual(resp.status_code, 400)
+
+	def test_malformed_cursor_is_rejected(self):
+		url = reverse('onlineshopfront:api_product_list')
+		name_cursor = self.client.get(url, {'limit': 2}).json()['next']
+		for sort, values in (('price_desc', [[1], 'BK-1']), ('price_desc', ['cheap', 'BK-1']),
+							 ('rating_asc', [4.0, 7]), ('price_asc', {'a': 1, 'b': 2}),
+							 ('available', [1.5, 'BK-1']), ('name_asc', [3, 'BK-1'])):
+			cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+			resp = self.client.get(url, {'sort': sort, 'cursor': cursor})
+			self.assertEqual(resp.status_code, 400, (sort, values))
+		# a cursor from another sort
+		self.assertEqual(self.client.get(url, {'sort': 'price_asc', 'cursor': name_cursor}).status_code, 400)
+		self.assertEqual(self.client.get(url, {'sort': 'name_asc', 'cursor': name_cursor}).status_code, 200)
+
+
+class ProductFeedTests(TestCase):
+	def setUp(self):
+		for i in range(3):
+			make_product(f'BK-{i}', product_name=f'Book {i}', quantity_on_hand=i, unit_price=5.0)
+
+	def test_full_feed_and_delta(self):
+		url = reverse('onlineshopfront:product_feed')
+
+		resp = self.client.get(url)
+		rows = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+		self.assertEqual([r['sku'] for r in rows], ['BK-0', 'BK-1', 'BK-2'])
+
+		since = timezone.now()
+		Product.objects.update(updated_at=since - timedelta(days=1))
+		HiddenProduct.objects.create(product_id='BK-1')
+		Product.objects.get(pk='BK-2').save()
+		resp = self.client.get(url, {'format': 'csv', 'changed_since': since.isoformat()})
+		lines = b''.join(resp.streaming_content).decode().splitlines()
+		self.assertEqual(lines[0].split(',')[0], 'sku')
+		self.assertEqual(sorted(line.split(',')[0] for line in lines[1:]), ['BK-1', 'BK-2'])
+		self.assertIn('False', [line for line in lines if line.startswith('BK-1')][0])
+
+
+class CartServiceTests(TestCase):
+	def setUp(self):
+		sub = make_subcategory()
+		for i in range(30):
+			make_product(f'BK-{i}', sub, product_name=f'Book {i}', quantity_on_hand=10, unit_price=2.5)
+
+	def test_guest_cart_is_loaded_in_one_query(self):
+		lines = {f'BK-{i}': 2 for i in range(30)}
+		lines['GONE'] = 1
+		with self.assertNumQueries(1):
+			items, total = carts.guest_cart_items(lines)
+		self.assertEqual(len(items), 30)
+		self.assertEqual(total, 150.0)
+
+	def test_view_cart_renders_guest_cart(self):
+		self.client.post(reverse('onlineshopfront:add_to_cart', args=['BK-1']), {'quantity': 3},
+						 HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+		resp = self.client.get(reverse('onlineshopfront:view_cart'))
+		self.assertEqual(resp.context['total'], 7.5)
+		self.assertEqual(resp.context['items'][0]['name'], 'Book 1')
+
+	def test_guest_cart_lives_in_a_signed_cookie(self):
+		url = reverse('onlineshopfront:add_to_cart', args=['BK-1'])
+		for _ in range(2):
+			resp = self.client.post(url, {'quantity': 1}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+		self.assertEqual(resp.json()['cart_count'], 2)
+		self.client.get(reverse('onlineshopfront:product_list'))
+		self.assertFalse(Session.objects.exists())
+
+		self.client.cookies['cart'] = self.client.cookies['cart'].value + 'x'
+		resp = self.client.get(reverse('onlineshopfront:view_cart'))
+		self.assertEqual(resp.context['items'], [])
+
+	def test_full_guest_cart_is_reported_as_not_added(self):
+		detail = reverse('onlineshopfront:product_detail', args=['BK-1'])
+		with mock.patch.object(SignedCookieCartStorage, 'max_bytes', 10):
+			resp = self.client.post(reverse('onlineshopfront:add_to_cart', args=['BK-1']), {'quantity': 1},
+									HTTP_REFERER=detail, follow=True)
+		self.assertContains(resp, 'Not added')
+		self.assertContains(resp, 'Your cart is full.')
+		self.assertNotContains(resp, 'Added to cart')
+
+	def _customer_cart(self):
+		user = User.objects.create_user(username='shopper', email='shopper@example.com')
+		cust = make_customer(user)
+		return Cart.objects.create(cart_customer=cust)
+
+	def test_login_merges_guest_cart_in_fixed_queries(self):
+		cart = self._customer_cart()
+		cust = cart.cart_customer
+		CartItem.objects.create(cart=cart, product_id='BK-0', quantity=1)
+		sess_cart = {f'BK-{i}': 2 for i in range(30)}
+		sess_cart['GONE'] = 1
+		# cart get_or_create, products, existing items, bulk update, bulk create
+		# (+ savepoint bookkeeping)
+		with self.assertNumQueries(7):
+			carts.merge_guest_cart(cust, sess_cart)
+		quantities = dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+		self.assertEqual(len(quantities), 30)
+		self.assertEqual(quantities['BK-0'], 3)
+		self.assertEqual(quantities['BK-29'], 2)
+
+	def test_update_quantities_in_constant_statements(self):
+		cart = self._customer_cart()
+		CartItem.objects.bulk_create([CartItem(cart=cart, product_id=f'BK-{i}', quantity=1) for i in range(30)])
+		updates = {f'BK-{i}': 2 for i in range(20)}
+		updates.update({f'BK-{i}': 0 for i in range(20, 30)})
+		updates['BK-0'] = 11  # only 10 in stock
+		# savepoint, delete, fetch, bulk update, release
+		with self.assertNumQueries(5):
+			errors = carts.update_customer_quantities(cart.cart_customer.user, updates)
+		self.assertEqual(len(errors), 1)
+		quantities = dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+		self.assertEqual(len(quantities), 20)
+		self.assertEqual(quantities['BK-0'], 1)
+		self.assertEqual(quantities['BK-1'], 2)
+
+	def test_cart_count_is_shared_by_the_customers_sessions(self):
+		cache.clear()
+		cart = self._customer_cart()
+		phone, laptop = Client(), Client()
+		for client in (phone, laptop):
+			client.force_login(cart.cart_customer.user)
+		index = reverse('onlineshopfront:index')
+		self.assertEqual(laptop.get(index).context['cart_count'], 0)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			phone.post(reverse('onlineshopfront:add_to_cart', args=['BK-1']), {'quantity': 3})
+		self.assertEqual(laptop.get(index).context['cart_count'], 3)
+		with self.captureOnCommitCallbacks(execute=True):
+			phone.post(reverse('onlineshopfront:update_cart'), {'qty_BK-1': 2})
+		self.assertEqual(laptop.get(index).context['cart_count'], 2)
+		with self.captureOnCommitCallbacks(execute=True):
+			orders.place_order(cart.cart_customer, cart)
+		self.assertEqual(laptop.get(index).context['cart_count'], 0)
+
+	def test_hidden_products_are_left_out_of_carts_and_orders(self):
+		cache.clear()
+		HiddenProduct.objects.create(product_id='BK-2')
+		items, total = carts.guest_cart_items({'BK-1': 1, 'BK-2': 1})
+		self.assertEqual([item['sku'] for item in items], ['BK-1'])
+
+		cart = self._customer_cart()
+		CartItem.objects.create(cart=cart, product_id='BK-1', quantity=1)
+		CartItem.objects.create(cart=cart, product_id='BK-2', quantity=1)
+		user = cart.cart_customer.user
+		self.assertEqual([item['sku'] for item in carts.customer_cart_items(user)[0]], ['BK-1'])
+		self.assertEqual(carts.customer_cart_count(user), 1)
+		self.assertIsNone(orders.place_order(cart.cart_customer, cart, selected=['BK-2']))
+		with self.captureOnCommitCallbacks(execute=True):
+			order = orders.place_order(cart.cart_customer, cart)
+		self.assertEqual(list(order.order_items.values_list('product_id', flat=True)), ['BK-1'])
+		self.assertEqual(Product.objects.get(pk='BK-2').quantity_on_hand, 10)
+		self.assertEqual(list(cart.items.values_list('product_id', flat=True)), ['BK-2'])
+
+	def test_place_order_decrements_stock_atomically(self):
+		cart = self._customer_cart()
+		CartItem.objects.create(cart=cart, product_id='BK-1', quantity=4)
+		CartItem.objects.create(cart=cart, product_id='BK-2', quantity=11)  # only 10 in stock
+		with self.assertRaises(orders.InsufficientStock) as ctx:
+			orders.place_order(cart.cart_customer, cart)
+		self.assertEqual(ctx.exception.products, ['Book 2'])
+		self.assertEqual(Product.objects.get(pk='BK-1').quantity_on_hand, 10)
+		self.assertEqual(cart.items.count(), 2)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			order = orders.place_order(cart.cart_customer, cart, selected=['BK-1'])
+		self.assertEqual(order.order_price, 10.0)
+		self.assertEqual(list(order.order_items.values_list('product_id', 'quantity')), [('BK-1', 4)])
+		self.assertEqual(Product.objects.get(pk='BK-1').quantity_on_hand, 6)
+		self.assertEqual(list(cart.items.values_list('product_id', flat=True)), ['BK-2'])
+
+
+class StockReservationTests(TestCase):
+	def setUp(self):
+		self.product = make_product('HOT-1', product_name='Hot Book', quantity_on_hand=3)
+
+	def _cart(self, name):
+		user = User.objects.create_user(username=name, email=f'{name}@example.com')
+		cust = make_customer(user)
+		return Cart.objects.create(cart_customer=cust)
+
+	def test_rejected_add_is_reported_as_not_added(self):
+		self.client.force_login(self._cart('late').cart_customer.user)
+		detail = reverse('onlineshopfront:product_detail', args=['HOT-1'])
+		resp = self.client.post(reverse('onlineshopfront:add_to_cart', args=['HOT-1']), {'quantity': 5},
+								HTTP_REFERER=detail, follow=True)
+		self.assertContains(resp, 'Not added')
+		self.assertContains(resp, 'Sorry, only 3 of Hot Book left')
+		self.assertNotContains(resp, 'Added to cart')
+		self.assertFalse(CartItem.objects.exists())
+
+	def test_hold_is_rolled_back_with_a_failed_cart_write(self):
+		self.client.force_login(self._cart('unlucky').cart_customer.user)
+		with mock.patch.object(CartItem.objects, 'get_or_create', side_effect=DatabaseError):
+			with self.assertRaises(DatabaseError):
+				self.client.post(reverse('onlineshopfront:add_to_cart', args=['HOT-1']), {'quantity': 2})
+		self.assertEqual(Product.objects.get(pk='HOT-1').quantity_reserved, 0)
+		self.assertFalse(self.product.reservations.exists())
+
+	def test_cart_update_counts_other_carts_holds(self):
+		first, second = self._cart('first'), self._cart('second')
+		self.assertTrue(reservations.reserve(first, 'HOT-1', 2))
+		CartItem.objects.create(cart=first, product_id='HOT-1', quantity=2)
+		CartItem.objects.create(cart=second, product_id='HOT-1', quantity=1)
+		# 3 on hand, 2 of them held by the first cart
+		self.assertEqual(carts.update_customer_quantities(second.cart_customer.user, {'HOT-1': 2}),
+						 ['Only 1 of Hot Book available; quantity not changed.'])
+		self.assertEqual(carts.update_customer_quantities(first.cart_customer.user, {'HOT-1': 3}), [])
+		self.assertEqual(second.items.get().quantity, 1)
+		self.assertEqual(first.items.get().quantity, 3)
+
+	def test_holds_prevent_overselling_until_they_expire(self):
+		first, second = self._cart('first'), self._cart('second')
+		self.assertTrue(reservations.reserve(first, 'HOT-1', 2))
+		CartItem.objects.create(cart=first, product_id='HOT-1', quantity=2)
+		self.assertFalse(reservations.reserve(second, 'HOT-1', 2))
+		self.assertEqual(Product.objects.get(pk='HOT-1').quantity_available, 1)
+
+		# the second shopper can't buy the held units either
+		CartItem.objects.create(cart=second, product_id='HOT-1', quantity=2)
+		with self.assertRaises(orders.InsufficientStock):
+			orders.place_order(second.cart_customer, second)
+
+		# once the hold lapses and is swept the units are free again
+		self.assertEqual(reservations.release_expired(now=timezone.now() + timedelta(hours=1)), 1)
+		self.assertEqual(Product.objects.get(pk='HOT-1').quantity_reserved, 0)
+		self.assertEqual(reservations.sync_cart(second), [])
+		self.assertEqual(reservations.sync_cart(first), ['Hot Book'])
+		order = orders.place_order(second.cart_customer, second)
+		product = Product.objects.get(pk='HOT-1')
+		self.assertEqual(order.order_price, 20.0)
+		self.assertEqual((product.quantity_on_hand, product.quantity_reserved), (1, 1))
+		self.assertFalse(second.reservations.exists())
+
+
+class CheckoutIdempotencyTests(TestCase):
+	def setUp(self):
+		make_product('BK-1', product_name='Book 1')
+		self.user = User.objects.create_user(username='buyer', email='buyer@example.com')
+		cust = make_customer(self.user)
+		CartItem.objects.create(cart=Cart.objects.create(cart_customer=cust), product_id='BK-1', quantity=2)
+
+	def test_resubmitted_checkout_returns_original_order(self):
+		self.client.force_login(self.user)
+		url = reverse('onlineshopfront:checkout')
+		key = self.client.get(url).context['idempotency_key']
+		data = {'address': '1 Main St', 'postal_code': '123456', 'phone': '5550100',
+				'payment_method': 'Paynow', 'idempotency_key': key}
+		first = self.client.post(url, data)
+		with self.assertNumQueries(4):  # session, user, customer, order lookup; no writes
+			second = self.client.post(url, data)
+		self.assertEqual(first['Location'], second['Location'])
+		self.assertEqual(Order.objects.count(), 1)
+		self.assertEqual(Product.objects.get(pk='BK-1').quantity_on_hand, 3)
+
+
+class AsyncStorefrontTests(TransactionTestCase):
+	"""The async index/list/detail views render what the sync views do.
+
+	A TransactionTestCase, since the async views query from worker threads
+	that can't see a TestCase's uncommitted data.
+	"""
+	def setUp(self):
+		cache.clear()
+		sub = make_subcategory()
+		for i in range(6):
+			make_product(f'BK-{i}', sub, product_name=f'Book {i}', unit_price=10.0 + i, product_rating=float(i % 5))
+		self.user = User.objects.create_user(username='browser', email='browser@example.com')
+		cust = make_customer(self.user)
+		CartItem.objects.create(cart=Cart.objects.create(cart_customer=cust), product_id='BK-1', quantity=1)
+		self.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+	def _request(self, factory, path, headers=None):
+		request = factory.get(path, headers=headers)
+		request.session = self.session
+		request.user = self.user
+
+		async def auser():
+			return self.user
+		request.auser = auser
+		return request
+
+	def _html(self, response):
+		return CSRF_INPUT.sub(CSRF_PLACEHOLDER, response.content.decode())
+
+	def test_async_pages_match_sync_pages(self):
+		pages = [
+			('index', '/', {}),
+			('product_list', '/products/?sort=price_desc', {}),
+			('product_list', '/products/category/books/', {'category_slug': 'books'}),
+			('product_detail', '/products/BK-2/', {'pk': 'BK-2'}),
+		]
+		for name, path, kwargs in pages:
+			with self.subTest(path=path):
+				expected = getattr(views, name)(self._request(RequestFactory(), path), **kwargs)
+				response = async_to_sync(getattr(views_async, name))(self._request(AsyncRequestFactory(), path), **kwargs)
+				self.assertEqual(response.status_code, 200)
+				self.assertEqual(self._html(response), self._html(expected))
+
+	def test_async_detail_answers_conditional_get_and_404(self):
+		# only anonymous visitors get conditional responses
+		self.user = AnonymousUser()
+		detail = async_to_sync(views_async.product_detail)
+		first = detail(self._request(AsyncRequestFactory(), '/products/BK-2/'), pk='BK-2')
+		self.assertTrue(first.has_header('ETag'))
+		repeat = detail(self._request(AsyncRequestFactory(), '/products/BK-2/', headers={'If-None-Match': first['ETag']}), pk='BK-2')
+		self.assertEqual(repeat.status_code, 304)
+		with self.assertRaises(Http404):
+			detail(self._request(AsyncRequestFactory(), '/products/NOPE/'), pk='NOPE')
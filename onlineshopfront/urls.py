@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from . import views_async
 from . import views_cart
+from . import views_api
 
 app_name = "onlineshopfront"
 
+# index / product list / product detail, sync or async (see settings.ASYNC_STOREFRONT)
+storefront = views_async if settings.ASYNC_STOREFRONT else views
+
 urlpatterns = [
-    path("", views.index, name="index"),
+    path("", storefront.index, name="index"),
     path("create-account/", views.create_account, name="create_account"),
     path("login/", views.login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
@@ -14,9 +20,11 @@ urlpatterns = [
     path('myProfile/', views.myProfile, name='myProfile'),
     path('settings/', views.settings, name='settings'),
     path('profile/complete/', views.complete_profile, name='complete_profile'),
-    path("products/", views.product_list, name="product_list"),
-    path("products/category/<slug:category_slug>/", views.product_list, name="product_list_by_category"),
-    path("products/<str:pk>/", views.product_detail, name="product_detail"),
+    path("products/", storefront.product_list, name="product_list"),
+    path("products/category/<slug:category_slug>/", storefront.product_list, name="product_list_by_category"),
+    path("products/<str:pk>/", storefront.product_detail, name="product_detail"),
+    path("api/products/", views_api.product_list_api, name="api_product_list"),
+    path("api/feed/products/", views_api.product_feed, name="product_feed"),
     path('cart/', views_cart.view_cart, name='view_cart'),
     path('cart/add/<str:sku>/', views_cart.add_to_cart, name='add_to_cart'),
     path('cart/remove/<str:sku>/', views_cart.remove_from_cart, name='remove_from_cart'),
@@ -1,7 +1,7 @@
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.core.paginator import Paginator
-from .models import Product, Category, Cart, CartItem
+from .models import Product, Category
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
@@ -9,193 +9,63 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from . import recommender
+from . import caching
+from . import catalog
+from . import carts
+from .cart_storage import guest_cart
 
 User = get_user_model()
 
 
+@caching.catalog_conditional
+@caching.anonymous_page_cache
 def index(request):
     # show top-rated products and top-level categories
-    featured = Product.objects.all().order_by('-product_rating')[:12]
-    categories = Category.objects.all()
+    featured = caching.attach_card_versions(Product.objects.visible().order_by('-product_rating')[:12])
+    categories = caching.cached_categories()
     # Try to predict preferred category for authenticated users and show recommended products
     predicted_category = None
     recommended_products = None
     if request.user.is_authenticated:
-        try:
-            cust = getattr(request.user, 'customer_profile', None)
-            if cust is not None:
-                profile = {
-                    'age': getattr(cust, 'age', 0) or 0,
-                    'household_size': getattr(cust, 'household_size', 0) or 0,
-                    'has_children': getattr(cust, 'has_children', 0) or 0,
-                    'monthly_income_sgd': getattr(cust, 'monthly_income', None) or getattr(cust, 'monthly_income', 0.0) or 0.0,
-                    'gender': getattr(cust, 'gender', 'Male') or 'Male',
-                    'employment_status': getattr(cust, 'employment_status', 'Full-time') or 'Full-time',
-                    'occupation': getattr(cust, 'occupation', 'Other') or 'Other',
-                    'education': getattr(cust, 'education', 'Secondary') or 'Secondary'
-                }
-                try:
-                    predicted_category = recommender.predict_preferred_category(profile)
-                    if predicted_category:
-                        recommended_products = Product.objects.filter(product_category__iexact=predicted_category).order_by('-product_rating')[:24]
-                except Exception:
-                    predicted_category = None
-                    recommended_products = None
-        except Exception:
-            pass
+        predicted_category, recommended_products = catalog.predicted_recommendations(request.user, categories)
 
     return render(request, "onlineshopfront/index.html", {"featured": featured, "categories": categories, 'predicted_category': predicted_category, 'recommended_products': recommended_products})
 
 
 # In onlineshopfront/views.py
 
+@caching.catalog_conditional
+@caching.anonymous_page_cache
 def product_list(request, category_slug=None):
-    category = None
-    products = Product.objects.all().order_by("product_name")
+    categories = caching.cached_categories()
+    products, category = catalog.filter_products(request.GET, categories, category_slug)
     q = request.GET.get("q")
-    if q:
-        products = products.filter(product_name__icontains=q) | products.filter(sku__icontains=q)
-
-    if category_slug:
-        # Lookup Category by slug (we added a slug field)
-        category = get_object_or_404(Category, slug=category_slug)
-        # Products store category as text in `product_category`
-        products = products.filter(product_category__iexact=category.category_name)
-
-    # If category provided as a GET parameter (from the filter form), honor it too
-    if not category and request.GET.get('category'):
-        try:
-            get_cat = request.GET.get('category')
-            if get_cat:
-                cat = get_object_or_404(Category, slug=get_cat)
-                category = cat
-                products = products.filter(product_category__iexact=cat.category_name)
-        except Exception:
-            pass
-
-    # Filters: price range, rating, availability
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    min_rating = request.GET.get('min_rating')
-    available = request.GET.get('available')
-
-    try:
-        if min_price:
-            mp = float(min_price)
-            products = products.filter(unit_price__gte=mp)
-    except Exception:
-        pass
-
-    try:
-        if max_price:
-            mp = float(max_price)
-            products = products.filter(unit_price__lte=mp)
-    except Exception:
-        pass
-
-    try:
-        if min_rating:
-            mr = float(min_rating)
-            products = products.filter(product_rating__gte=mr)
-    except Exception:
-        pass
-
-    try:
-        if available and available.lower() in ('1','true','yes','on'):
-            products = products.filter(quantity_on_hand__gt=0)
-    except Exception:
-        pass
-
-    # Sorting
-    sort = request.GET.get('sort')
-    if sort:
-        # Map friendly sort names to ORM orderings
-        ordering_map = {
-            'price_asc': 'unit_price',
-            'price_desc': '-unit_price',
-            'rating_desc': '-product_rating',
-            'rating_asc': 'product_rating',
-            'name_asc': 'product_name',
-            'name_desc': '-product_name',
-            'available': '-quantity_on_hand',
-        }
-        order = ordering_map.get(sort)
-        if order:
-            try:
-                products = products.order_by(order)
-            except Exception:
-                pass
+    products = products.order_by(catalog.ordering_for(request.GET.get('sort')))
 
-    # --- START: "Next Best Action" AI Logic ---
+    # "Next Best Action": cart-based recommendations outside this listing
     next_best_products = []
     if request.user.is_authenticated:
-        try:
-            skus_in_cart = []
-            cust = getattr(request.user, 'customer_profile', None)
-            cart = Cart.objects.filter(cart_customer=cust).first()
-            if cart:
-                # Get all SKUs from the user's cart
-                skus_in_cart = [item.product.sku for item in cart.items.all()]
-
-            if skus_in_cart:
-                # Get recommendations based on the cart
-                recommended_skus = recommender.get_associated_products(skus_in_cart)
-                
-                # Get SKUs for products in the category we are *already* viewing
-                current_category_skus = list(products.values_list('sku', flat=True))
-                
-                # Find products that are:
-                # 1. Recommended by the AI
-                # 2. NOT already in the cart
-                # 3. NOT in the category we are currently looking at
-                next_best_products = Product.objects.filter(
-                    sku__in=recommended_skus
-                ).exclude(
-                    sku__in=skus_in_cart
-                ).exclude(
-                    sku__in=current_category_skus
-                )[:4] # Show top 4
-                
-        except Exception as e:
-            print(f"Error getting next best action: {e}")
-    # --- END: "Next Best Action" AI Logic ---
+        next_best_products = catalog.next_best_products(request.user, products)
 
     # pagination
     paginator = Paginator(products, 24)  # 24 products per page
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
-
-    # Prepare similar-products for items on the current page.
-    try:
-        # collect subcategory ids for products on this page
-        subcat_ids = {getattr(p, 'product_subcategory_id', None) for p in page_obj.object_list}
-        subcat_ids.discard(None)
-        # fetch other products in those subcategories (exclude the current page SKUs)
-        page_skus = [getattr(p, 'sku', None) for p in page_obj.object_list]
-        similar_qs = Product.objects.filter(product_subcategory_id__in=subcat_ids).exclude(sku__in=page_skus).order_by('-product_rating')
-        # group by subcategory id
-        from collections import defaultdict
-        sim_map = defaultdict(list)
-        for s in similar_qs:
-            sim_map[getattr(s, 'product_subcategory_id', None)].append(s)
-
-        # attach up to 4 similar products to each product on the page
-        for p in page_obj.object_list:
-            p.similar_products = sim_map.get(getattr(p, 'product_subcategory_id', None), [])[:4]
-    except Exception:
-        # on any error, ensure attribute exists to avoid template errors
-        for p in page_obj.object_list:
-            setattr(p, 'similar_products', [])
+    # card fragments are cached per SKU; look up their versions in one go
+    page_obj.object_list = caching.attach_card_versions(page_obj.object_list)
+    # up to 4 similar products for each item on the page
+    catalog.attach_similar_products(page_obj.object_list)
 
     # Pop any in-card notification set by add_to_cart for non-JS clients
     in_card_notif = None  # <-- THE FIX: Initialize to None
     try:
-        in_card_notif = request.session.pop('in_card_notif', None)
-        request.session.modified = True
+        # pop() only marks the session modified when the key was there, so
+        # ordinary page views don't rewrite the session row
+        if 'in_card_notif' in request.session:
+            in_card_notif = request.session.pop('in_card_notif')
     except Exception:
         pass # It's already None
 
-    categories = Category.objects.all()
     # Rating choices as strings so template comparisons work with request.GET values
     rating_choices = [str(x) for x in range(0, 6)]
     
@@ -209,36 +79,19 @@ def product_list(request, category_slug=None):
         'next_best_products': next_best_products  # <-- Added this
     })
 
+@caching.catalog_conditional
+@caching.anonymous_page_cache
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    categories = Category.objects.all()
+    product = get_object_or_404(Product.objects.visible(), pk=pk)
+    categories = caching.cached_categories()
     in_card_notif = request.session.pop('in_card_notif', None)
 
-    # --- AI RECOMMENDATIONS (Frequently Bought Together) ---
-    recommended_products = []
-    try:
-        # 1. Get the SKU of the current product as a list
-        current_sku = [product.sku]
-        
-        # 2. Get associated SKUs from the recommender
-        recommended_skus = recommender.get_associated_products(current_sku)
-        
-        # 3. Fetch the actual Product objects
-        if recommended_skus:
-            # Get the first 4 recommendations, excluding the product itself
-            recommended_products = Product.objects.filter(sku__in=recommended_skus).exclude(pk=product.pk)[:4]
-            
-    except Exception as e:
-        print(f"Error getting product recommendations: {e}")
-        recommended_products = []
-    # --- END AI RECOMMENDATIONS ---
-
-    # Your original "Similar products" code
-    similar_products = []
-    try:
-        similar_products = Product.objects.filter(product_subcategory=product.product_subcategory).exclude(pk=product.pk).order_by('-product_rating')[:5]
-    except Exception:
-        similar_products = []
+    # frequently bought together, and top-rated from the same subcategory
+    recommended_products = catalog.recommended_for(product.pk)
+    similar_products = catalog.similar_to(product.pk)
+
+    # fetch all card versions (this product, recommendations, similar) at once
+    caching.attach_card_versions([product, *recommended_products, *similar_products])
 
     # Add recommended_products to the context
     return render(request, "onlineshopfront/product_detail.html", {
@@ -318,9 +171,8 @@ def settings(request):
 
 def create_account(request):
     # prepare categories for the form (fixed list users can choose from)
-    from .models import Category as CustomerCategory
     try:
-        categories = list(CustomerCategory.objects.all())
+        categories = caching.cached_categories()
     except Exception:
         categories = []
 
@@ -525,26 +377,13 @@ def login_view(request):
             except Customer.DoesNotExist:
                 cust = None
 
-        # merge any session-based guest cart into the user's DB cart
+        # merge any guest cart into the user's DB cart
         try:
-            sess_cart = request.session.get('cart', {})
-            if sess_cart and cust is not None:
-                cart_obj, _ = Cart.objects.get_or_create(cart_customer=cust)
-                for sku, qty in list(sess_cart.items()):
-                    try:
-                        prod = Product.objects.get(pk=sku)
-                    except Product.DoesNotExist:
-                        continue
-                    ci, created = CartItem.objects.get_or_create(cart=cart_obj, product=prod, defaults={'quantity': int(qty)})
-                    if not created:
-                        ci.quantity = ci.quantity + int(qty)
-                        ci.save()
-                # clear session cart after merging
-                try:
-                    del request.session['cart']
-                    request.session.modified = True
-                except Exception:
-                    pass
+            storage = guest_cart(request)
+            if storage.lines and cust is not None:
+                carts.merge_guest_cart(cust, storage.lines)
+                # clear the guest cart after merging
+                storage.clear()
         except Exception:
             # don't let merge errors block login
             pass
@@ -569,7 +408,7 @@ def login_view(request):
         # After sign-in always go to home page
         messages.success(request, 'Signed in')
         return redirect('onlineshopfront:index')
-    categories = Category.objects.all()
+    categories = caching.cached_categories()
     return render(request, 'onlineshopfront/login.html', {'categories': categories})
 
 
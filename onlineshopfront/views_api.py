@@ -0,0 +1,141 @@
+import base64
+import json
+import math
+
+from django.db.models import Q
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+
+from . import caching
+from . import catalog
+from . import feeds
+from .models import Product
+
+# public field name -> ORM path selected with .values()
+API_FIELDS = {
+    'sku': 'sku',
+    'name': 'product_name',
+    'description': 'product_description',
+    'price': 'unit_price',
+    'rating': 'product_rating',
+    'stock': 'quantity_on_hand',
+    'category': 'category__slug',
+    'subcategory': 'product_subcategory__subcategory_name',
+}
+DEFAULT_FIELDS = ['sku', 'name', 'price', 'rating', 'stock', 'category']
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def _cursor_types(field):
+    internal_type = Product._meta.get_field(field).get_internal_type()
+    if internal_type == 'FloatField':
+        return (int, float)
+    if internal_type == 'IntegerField':
+        return int
+    return str
+
+
+def _decode_cursor(cursor, field):
+    """(value, sku) from ``cursor``; ValueError unless the value suits ``field``.
+
+    A cursor from another ``sort``, or one built by hand, would otherwise
+    fail inside the queryset filter.
+    """
+    try:
+        value, sku = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if (not isinstance(sku, str) or isinstance(value, bool) or not isinstance(value, _cursor_types(field))
+            or (isinstance(value, float) and not math.isfinite(value))):
+        raise ValueError('Invalid cursor')
+    return value, sku
+
+
+def _after_cursor(order, value, sku):
+    """Keyset condition for rows after (value, sku) in ``order_by(order, 'sku')``."""
+    field = order.lstrip('-')
+    op = 'lt' if order.startswith('-') else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, 'sku__gt': sku})
+
+
+@require_GET
+@gzip_page
+def product_list_api(request):
+    """Read-only JSON product listing.
+
+    Accepts the same filter/sort parameters as the HTML product list plus
+    ``fields`` (comma separated, see API_FIELDS), ``limit`` and ``cursor``.
+    Pages are keyset-paginated on (sort column, sku), so deep pages cost the
+    same as the first one; ``next`` is the cursor for the following page.
+    """
+    params = request.GET
+    fields = [f.strip() for f in (params.get('fields') or '').split(',') if f.strip()] or DEFAULT_FIELDS
+    unknown = [f for f in fields if f not in API_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+
+    try:
+        limit = min(max(int(params.get('limit') or DEFAULT_LIMIT), 1), MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+
+    try:
+        products, _category = catalog.filter_products(params, caching.cached_categories(), params.get('category') or None)
+    except Http404:
+        return JsonResponse({'error': 'Unknown category'}, status=404)
+
+    order = catalog.ordering_for(params.get('sort'))
+    sort_field = order.lstrip('-')
+    products = products.order_by(order, 'sku')
+
+    if params.get('cursor'):
+        try:
+            value, sku = _decode_cursor(params['cursor'], sort_field)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        products = products.filter(_after_cursor(order, value, sku))
+
+    # the sort column and sku are always selected so the next cursor can be built
+    columns = {API_FIELDS[f] for f in fields} | {sort_field, 'sku'}
+    rows = list(products.values(*columns)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_cursor([last[sort_field], last['sku']])
+
+    results = [{f: row[API_FIELDS[f]] for f in fields} for row in rows]
+    return JsonResponse({'results': results, 'next': next_cursor})
+
+
+@require_GET
+def product_feed(request):
+    """Stream the product feed as NDJSON (default) or CSV.
+
+    ``?format=csv`` switches format and ``?changed_since=<ISO date/time>``
+    limits the feed to products modified since then.
+    """
+    fmt = request.GET.get('format') or 'ndjson'
+    if fmt not in feeds.FEED_FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(feeds.FEED_FORMATS)}"}, status=400)
+    changed_since = None
+    if request.GET.get('changed_since'):
+        try:
+            changed_since = feeds.parse_changed_since(request.GET['changed_since'])
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+    resp = StreamingHttpResponse(feeds.feed_lines(fmt, changed_since=changed_since), content_type=content_type)
+    stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    resp['Content-Disposition'] = f'attachment; filename="products_feed_{stamp}.{fmt}"'
+    return resp
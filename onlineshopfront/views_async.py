@@ -0,0 +1,118 @@
+"""Async versions of the storefront's index, product list and detail pages.
+
+Routed instead of the views in ``views.py`` when ``ASYNC_STOREFRONT`` is on
+and the site runs under an ASGI server (``auroramartproj.asgi``). The
+lookups a page needs that don't depend on one another (featured products,
+recommendations, similar products, the page of results, ...) run
+concurrently, each in a worker thread with its own database connection;
+Django's async ORM alone would run them one after another on the single
+thread that sync code shares. Pages are built from the same helpers as
+the sync views and render the same output.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.db import close_old_connections
+from django.shortcuts import aget_object_or_404, render
+
+from .models import Product
+from . import caching
+from . import catalog
+
+_render = sync_to_async(render)
+
+
+async def _off_thread(func, *args):
+    """Run ``func(*args)`` in a worker thread of its own.
+
+    The thread's database connection is closed again afterwards unless
+    ``CONN_MAX_AGE`` lets it persist, as happens to a request's connection.
+    """
+    def call():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+def _featured():
+    return caching.attach_card_versions(Product.objects.visible().order_by('-product_rating')[:12])
+
+
+@caching.catalog_conditional
+@caching.anonymous_page_cache
+async def index(request):
+    user = await request.auser()
+    categories = await _off_thread(caching.cached_categories)
+    predicted_category = None
+    recommended_products = None
+    if user.is_authenticated:
+        featured, (predicted_category, recommended_products) = await asyncio.gather(
+            _off_thread(_featured),
+            _off_thread(catalog.predicted_recommendations, user, categories),
+        )
+    else:
+        featured = await _off_thread(_featured)
+
+    return await _render(request, "onlineshopfront/index.html", {"featured": featured, "categories": categories, 'predicted_category': predicted_category, 'recommended_products': recommended_products})
+
+
+def _product_page(products, page_number):
+    page_obj = Paginator(products, 24).get_page(page_number)
+    page_obj.object_list = caching.attach_card_versions(page_obj.object_list)
+    catalog.attach_similar_products(page_obj.object_list)
+    return page_obj
+
+
+@caching.catalog_conditional
+@caching.anonymous_page_cache
+async def product_list(request, category_slug=None):
+    user = await request.auser()
+    categories = await _off_thread(caching.cached_categories)
+    products, category = catalog.filter_products(request.GET, categories, category_slug)
+    products = products.order_by(catalog.ordering_for(request.GET.get('sort')))
+
+    lookups = [_off_thread(_product_page, products, request.GET.get("page"))]
+    if user.is_authenticated:
+        lookups.append(_off_thread(catalog.next_best_products, user, products))
+    page_obj, *next_best = await asyncio.gather(*lookups)
+
+    # pop() only marks the session modified when the key was there
+    in_card_notif = await request.session.apop('in_card_notif', None)
+
+    return await _render(request, "onlineshopfront/product_list.html", {
+        "category": category,
+        "products": page_obj,
+        "q": request.GET.get("q"),
+        "categories": categories,
+        'in_card_notif': in_card_notif,
+        'rating_choices': [str(x) for x in range(0, 6)],
+        'next_best_products': next_best[0] if next_best else [],
+    })
+
+
+@caching.catalog_conditional
+@caching.anonymous_page_cache
+async def product_detail(request, pk):
+    # recommendations and similar products only need the SKU, so they are
+    # fetched alongside the product rather than after it
+    product, categories, recommended_products, similar_products = await asyncio.gather(
+        aget_object_or_404(Product.objects.visible(), pk=pk),
+        _off_thread(caching.cached_categories),
+        _off_thread(catalog.recommended_for, pk),
+        _off_thread(catalog.similar_to, pk),
+    )
+    in_card_notif = await request.session.apop('in_card_notif', None)
+
+    # fetch all card versions (this product, recommendations, similar) at once
+    await sync_to_async(caching.attach_card_versions)([product, *recommended_products, *similar_products])
+
+    return await _render(request, "onlineshopfront/product_detail.html", {
+        "product": product,
+        "categories": categories,
+        'in_card_notif': in_card_notif,
+        'similar_products': similar_products,
+        'recommended_products': recommended_products,
+    })
@@ -1,25 +1,22 @@
+import secrets
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from .models import Product, Cart, CartItem, Customer
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db import models
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import Order, OrderItem
-from . import recommender
-
-
-def _get_or_create_session_cart(session):
-    cart = session.get('cart')
-    if cart is None:
-        session['cart'] = {}
-        session.modified = True
-        cart = session['cart']
-    return cart
+from .models import Order
+from . import carts
+from . import orders
+from . import reservations
+from .cart_storage import guest_cart
 
 
 def add_to_cart(request, sku):
-    product = get_object_or_404(Product, pk=sku)
+    product = get_object_or_404(Product.objects.visible(), pk=sku)
     qty = int(request.POST.get('quantity', 1)) if request.method == 'POST' else 1
 
     if request.user.is_authenticated:
@@ -36,15 +33,22 @@ def add_to_cart(request, sku):
                 cust = None
 
         cart, _ = Cart.objects.get_or_create(cart_customer=cust)
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': qty})
-        if not created:
-            item.quantity += qty
-            item.save()
-        # compute cart count (sum of quantities)
-        try:
-            cart_count = cart.items.aggregate(total=models.Sum('quantity'))['total'] or 0
-        except Exception:
-            cart_count = cart.items.count() if cart else 0
+        # hold the units before adding them so a sold-out SKU never lands in
+        # the cart; the hold and the cart line commit (or roll back) together
+        with transaction.atomic():
+            held = reservations.reserve(cart, product.pk, qty)
+            if held:
+                item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': qty})
+                if not created:
+                    CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + qty)
+        if not held:
+            text = f'Sorry, only {product.quantity_available} of {product.product_name} left'
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'error': text}, status=409)
+            request.session['in_card_notif'] = {'sku': str(product.pk), 'text': text, 'type': 'error'}
+            return redirect(request.META.get('HTTP_REFERER') or reverse('onlineshopfront:product_list'))
+        carts.forget_cart_count(request.user.pk)
+        cart_count = carts.customer_cart_count(request.user)
 
         # For non-JS clients, set an in-card notification in the session so the
         # next rendered page can show a small boxed message near the product's
@@ -61,15 +65,17 @@ def add_to_cart(request, sku):
 
         return redirect(request.META.get('HTTP_REFERER') or reverse('onlineshopfront:product_list'))
     else:
-        sess_cart = _get_or_create_session_cart(request.session)
-        sess_cart[sku] = sess_cart.get(sku, 0) + qty
-        request.session.modified = True
-
-        # compute cart count for guest (sum quantities)
-        try:
-            cart_count = sum(int(v) for v in request.session.get('cart', {}).values())
-        except Exception:
-            cart_count = len(request.session.get('cart', {}))
+        storage = guest_cart(request)
+        lines = dict(storage.lines)
+        lines[sku] = lines.get(sku, 0) + qty
+        if not storage.fits(lines):
+            text = 'Your cart is full. Please sign in to add more items.'
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'error': text}, status=409)
+            request.session['in_card_notif'] = {'sku': str(product.pk), 'text': text, 'type': 'error'}
+            return redirect(request.META.get('HTTP_REFERER') or reverse('onlineshopfront:product_list'))
+        storage.set(lines)
+        cart_count = storage.count()
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'success': True, 'product_name': product.product_name, 'cart_count': cart_count})
@@ -84,46 +90,14 @@ def add_to_cart(request, sku):
 
 
 def view_cart(request):
-    items = []
-    total = 0.0
-    if request.user.is_authenticated:
-        try:
-            cust = request.user.customer_profile
-            cart = Cart.objects.filter(cart_customer=cust).first()
-            if cart:
-                for ci in cart.items.select_related('product').all():
-                    subtotal = ci.quantity * ci.product.unit_price
-                    items.append({'sku': ci.product.sku, 'name': ci.product.product_name, 'price': ci.product.unit_price, 'quantity': ci.quantity, 'subtotal': subtotal, 'product': ci.product})
-                    total += subtotal
-        except Exception:
-            items = []
-    else:
-        sess = request.session.get('cart', {})
-        for sku, qty in sess.items():
-            try:
-                p = Product.objects.get(pk=sku)
-                subtotal = int(qty) * p.unit_price
-                items.append({'sku': p.sku, 'name': p.product_name, 'price': p.unit_price, 'quantity': int(qty), 'subtotal': subtotal, 'product': p})
-                total += subtotal
-            except Product.DoesNotExist:
-                continue
+    try:
+        items, total = carts.cart_items(request)
+    except Exception:
+        items, total = [], 0.0
 
     notice = request.session.pop('cart_notice', None)
 
-    # --- AI RECOMMENDATION (FIXED) ---
-    recommended_products = []
-    try:
-        cart_skus = [item['sku'] for item in items]
-        if cart_skus:
-            # FIXED: Correct function name
-            recommended_skus = recommender.get_associated_products(cart_skus)
-            
-            if recommended_skus:
-                # Get the Product objects and limit to 4
-                recommended_products = Product.objects.filter(sku__in=recommended_skus).exclude(sku__in=cart_skus)[:4]
-    except Exception as e:
-        print(f"Recommendation failed in cart: {e}")
-    # --- END AI RECOMMENDATION ---
+    recommended_products = carts.recommended_products(items)
 
     context = {
         'items': items,
@@ -140,13 +114,13 @@ def remove_from_cart(request, sku):
             cart = Cart.objects.filter(cart_customer=cust).first()
             if cart:
                 CartItem.objects.filter(cart=cart, product_id=sku).delete()
+                carts.forget_cart_count(request.user.pk)
+                reservations.sync_cart(cart)
         except Exception:
             pass
     else:
-        sess = request.session.get('cart', {})
-        if sku in sess:
-            del sess[sku]
-            request.session.modified = True
+        storage = guest_cart(request)
+        storage.set({k: v for k, v in storage.lines.items() if k != sku})
 
     # Do not add a flash message here to avoid showing it in the header area.
     return redirect('onlineshopfront:view_cart')
@@ -156,35 +130,33 @@ def update_cart(request):
     if request.method != 'POST':
         return redirect('onlineshopfront:view_cart')
 
-    updates = {k.replace('qty_',''): int(v) for k,v in request.POST.items() if k.startswith('qty_')}
+    updates = {}
+    for k, v in request.POST.items():
+        if k.startswith('qty_'):
+            try:
+                updates[k.replace('qty_', '')] = int(v)
+            except ValueError:
+                continue
+    errors = []
     if request.user.is_authenticated:
         try:
-            cust = request.user.customer_profile
-            cart = Cart.objects.filter(cart_customer=cust).first()
+            errors = carts.update_customer_quantities(request.user, updates)
+            cart = Cart.objects.filter(cart_customer__user=request.user).first()
             if cart:
-                for sku, qty in updates.items():
-                    if qty <= 0:
-                        CartItem.objects.filter(cart=cart, product_id=sku).delete()
-                    else:
-                        ci = CartItem.objects.filter(cart=cart, product_id=sku).first()
-                        if ci:
-                            ci.quantity = qty
-                            ci.save()
+                short = reservations.sync_cart(cart)
+                if short:
+                    errors.append(f"Could not hold all units of {', '.join(short)}; they may sell out before checkout.")
         except Exception:
             pass
     else:
-        sess = request.session.get('cart', {})
-        for sku, qty in updates.items():
-            if qty <= 0:
-                sess.pop(sku, None)
-            else:
-                sess[sku] = qty
-        request.session.modified = True
+        storage = guest_cart(request)
+        lines = dict(storage.lines)
+        errors = carts.update_guest_quantities(lines, updates)
+        storage.set(lines)
 
     # set an inline cart notice in session instead of a global flash message
     try:
-        request.session['cart_notice'] = 'Cart updated'
-        request.session.modified = True
+        request.session['cart_notice'] = ' '.join(errors) if errors else 'Cart updated'
     except Exception:
         pass
     return redirect('onlineshopfront:view_cart')
@@ -195,21 +167,20 @@ def checkout(request):
     POST will create an Order from the user's cart and clear it, then redirect to success.
     """
     if request.method == 'GET':
-        items = []
-        total = 0.0
-        if request.user.is_authenticated:
-            try:
-                cust = request.user.customer_profile
-                cart = Cart.objects.filter(cart_customer=cust).first()
-                if cart:
-                    for ci in cart.items.select_related('product').all():
-                        subtotal = ci.quantity * ci.product.unit_price
-                        items.append({'sku': ci.product.sku, 'name': ci.product.product_name, 'price': ci.product.unit_price, 'quantity': ci.quantity, 'subtotal': subtotal, 'product': ci.product})
-                        total += subtotal
-            except Exception:
-                items = []
-        else:
+        if not request.user.is_authenticated:
             return redirect(f"{reverse('onlineshopfront:login')}?next={reverse('onlineshopfront:checkout')}")
+        try:
+            # checkout start: re-hold every line for another TTL
+            cart = Cart.objects.filter(cart_customer__user=request.user).first()
+            short = reservations.sync_cart(cart) if cart else []
+            if short:
+                messages.warning(request, f"Only limited stock is left for {', '.join(short)}.")
+        except Exception:
+            pass
+        try:
+            items, total = carts.customer_cart_items(request.user)
+        except Exception:
+            items, total = [], 0.0
 
         initial = {}
         try:
@@ -222,22 +193,13 @@ def checkout(request):
         except Exception:
             pass
 
-        # --- AI RECOMMENDATION (FIXED) ---
-        recommended_products = []
-        try:
-            cart_skus = [item['sku'] for item in items]
-            if cart_skus:
-                recommended_skus = recommender.get_associated_products(cart_skus)
-                if recommended_skus:
-                    recommended_products = Product.objects.filter(sku__in=recommended_skus).exclude(sku__in=cart_skus)[:4]
-        except Exception as e:
-            print(f"Recommendation failed in checkout: {e}")
-        # --- END AI RECOMMENDATION ---
+        recommended_products = carts.recommended_products(items)
 
         return render(request, 'onlineshopfront/checkout.html', {
             'items': items, 
             'total': total, 
             'initial': initial,
+            'idempotency_key': secrets.token_urlsafe(32),
             'recommended_products': recommended_products  # <-- Added this
         })
 
@@ -253,6 +215,12 @@ def checkout(request):
         messages.error(request, 'Please complete your profile before checking out.')
         return redirect('onlineshopfront:complete_profile')
 
+    # a resubmitted form (double click, retry) goes to the order it placed
+    idempotency_key = (request.POST.get('idempotency_key') or '').strip()[:64]
+    order = orders.placed_order(cust, idempotency_key)
+    if order is not None:
+        return redirect('onlineshopfront:checkout_success', order_id=order.order_id)
+
     cart = Cart.objects.filter(cart_customer=cust).first()
     if not cart or not cart.items.exists():
         messages.error(request, 'Your cart is empty.')
@@ -295,27 +263,11 @@ def checkout(request):
             errors['card_cvv'] = 'Invalid CVV.'
 
     if errors:
-        items = []
-        total = 0.0
         try:
-            for ci in cart.items.select_related('product').all():
-                subtotal = ci.quantity * ci.product.unit_price
-                items.append({'sku': ci.product.sku, 'name': ci.product.product_name, 'price': ci.product.unit_price, 'quantity': ci.quantity, 'subtotal': subtotal})
-                total += subtotal
+            items, total = carts.db_cart_items(cart.items.all())
         except Exception:
-            items = []
-        
-        # --- RE-ADD RECOMMENDATIONS ON ERROR ---
-        recommended_products = []
-        try:
-            cart_skus = [item['sku'] for item in items]
-            if cart_skus:
-                recommended_skus = recommender.get_associated_products(cart_skus)
-                if recommended_skus:
-                    recommended_products = Product.objects.filter(sku__in=recommended_skus).exclude(sku__in=cart_skus)[:4]
-        except Exception:
-            pass # Fail silently
-        # --- END ---
+            items, total = [], 0.0
+        recommended_products = carts.recommended_products(items)
 
         form_values = {
             'address': address,
@@ -343,45 +295,24 @@ def checkout(request):
             'errors': errors, 
             'form': form_values, 
             'initial': initial,
+            'idempotency_key': idempotency_key or secrets.token_urlsafe(32),
             'recommended_products': recommended_products # <-- Added this
         })
 
-    # create order
-    order = Order.objects.create(order_status='Order Placed', order_date=timezone.now().date(), order_price=0.0, required_date=timezone.now().date(), shipping_fee=0.0, customer=cust)
-
-    selected = request.POST.getlist('selected') if request.method == 'POST' else []
-    if selected:
-        created_any = False
-        for ci in cart.items.select_related('product').all():
-            if str(ci.product.sku) in selected:
-                OrderItem.objects.create(order=order, product=ci.product, quantity=ci.quantity, unit_price=ci.product.unit_price)
-                ci.delete()
-                created_any = True
-        if not created_any:
-            order.delete()
-            messages.error(request, 'No selected items were found in your cart.')
-            return redirect('onlineshopfront:view_cart')
-    else:
-        for ci in cart.items.select_related('product').all():
-            OrderItem.objects.create(order=order, product=ci.product, quantity=ci.quantity, unit_price=ci.product.unit_price)
-        cart.items.all().delete()
-
+    selected = request.POST.getlist('selected')
     try:
-        order.update_order_total()
-    except Exception:
-        pass
+        order = orders.place_order(cust, cart, selected, idempotency_key=idempotency_key)
+    except orders.InsufficientStock as e:
+        messages.error(request, f"Not enough stock for {', '.join(e.products) or 'some items'}. Please update your cart.")
+        return redirect('onlineshopfront:view_cart')
+    if order is None:
+        messages.error(request, 'No selected items were found in your cart.')
+        return redirect('onlineshopfront:view_cart')
 
     try:
-        if request.session.get('cart'):
-            if selected:
-                sess = request.session.get('cart', {})
-                for s in selected:
-                    sess.pop(s, None)
-                request.session['cart'] = sess
-                request.session.modified = True
-            else:
-                request.session.pop('cart', None)
-                request.session.modified = True
+        storage = guest_cart(request)
+        if storage.lines:
+            storage.set({k: v for k, v in storage.lines.items() if selected and k not in selected})
     except Exception:
         pass
 